@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+from sqlalchemy.engine import Engine
+
+BACKUP_DIR = Path(
+    os.environ.get(
+        "CIRCUITS_BACKUP_DIR", str(Path(__file__).resolve().parent.parent / "backups")
+    )
+)
+BACKUP_INTERVAL_SECONDS = int(os.environ.get("CIRCUITS_BACKUP_INTERVAL_SECONDS", "0"))
+BACKUP_RETENTION = int(os.environ.get("CIRCUITS_BACKUP_RETENTION", "7"))
+BACKUP_COMPRESS = os.environ.get("CIRCUITS_BACKUP_COMPRESS", "1") not in {"0", "false", "no"}
+
+SNAPSHOT_PREFIX = "circuits-"
+SNAPSHOT_SUFFIXES = (".db", ".db.gz")
+
+_backup_lock = threading.Lock()
+
+
+def _snapshot_name(now: datetime, compress: bool) -> str:
+    stamp = now.strftime("%Y%m%dT%H%M%S%fZ")
+    return f"{SNAPSHOT_PREFIX}{stamp}{'.db.gz' if compress else '.db'}"
+
+
+def list_snapshots(directory: Path = BACKUP_DIR) -> List[Path]:
+    if not directory.is_dir():
+        return []
+    snapshots = [
+        path
+        for path in directory.iterdir()
+        if path.is_file()
+        and path.name.startswith(SNAPSHOT_PREFIX)
+        and path.name.endswith(SNAPSHOT_SUFFIXES)
+    ]
+    return sorted(snapshots, key=lambda path: path.name)
+
+
+def prune_snapshots(
+    directory: Path = BACKUP_DIR, keep: int = BACKUP_RETENTION, room: int = 0
+) -> List[Path]:
+    """Delete old snapshots so ``room`` new ones fit within ``keep``.
+
+    Callers prune before creating a snapshot rather than after, so they never
+    delete the copy they are about to serve. The newest snapshot is always
+    kept for the same reason when another request is pruning concurrently.
+    """
+
+    if keep <= 0:
+        return []
+    snapshots = list_snapshots(directory)
+    retained = max(keep - room, 1)
+    removed = snapshots[: max(len(snapshots) - retained, 0)]
+    for path in removed:
+        path.unlink(missing_ok=True)
+    return removed
+
+
+def create_snapshot(
+    engine: Engine,
+    directory: Path = BACKUP_DIR,
+    compress: bool = BACKUP_COMPRESS,
+) -> Path:
+    """Copy the live database into ``directory`` with SQLite's backup API.
+
+    The copy is taken in a single step. In WAL mode that holds a read snapshot
+    which does not block writers, whereas a stepped backup starts over every
+    time another connection writes and may never finish on a busy database.
+    The copy is written to a temporary file and renamed into place, so a
+    snapshot that shows up in ``list_snapshots`` is always complete.
+    """
+
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / _snapshot_name(datetime.utcnow(), compress)
+    partial = directory / (target.name + ".partial")
+    raw_copy = partial.with_suffix(".db-copy")
+
+    with _backup_lock:
+        source = engine.raw_connection()
+        try:
+            destination = sqlite3.connect(raw_copy)
+            try:
+                source.driver_connection.backup(destination, pages=-1)
+            finally:
+                destination.close()
+        finally:
+            source.close()
+
+        try:
+            if compress:
+                with open(raw_copy, "rb") as src, gzip.open(partial, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                raw_copy.unlink()
+            else:
+                raw_copy.replace(partial)
+            partial.replace(target)
+        finally:
+            raw_copy.unlink(missing_ok=True)
+            partial.unlink(missing_ok=True)
+    return target
+
+
+def run_scheduled_backup(
+    engine: Engine,
+    directory: Path = BACKUP_DIR,
+    interval_seconds: int = BACKUP_INTERVAL_SECONDS,
+    keep: int = BACKUP_RETENTION,
+) -> Path | None:
+    """Take a snapshot unless a recent one exists, then apply retention.
+
+    Every uvicorn worker runs the schedule; checking the newest snapshot's
+    age keeps them from producing one copy each.
+    """
+
+    snapshots = list_snapshots(directory)
+    if snapshots:
+        newest_age = datetime.now() - datetime.fromtimestamp(snapshots[-1].stat().st_mtime)
+        if newest_age < timedelta(seconds=interval_seconds / 2):
+            return None
+    prune_snapshots(directory, keep, room=1)
+    return create_snapshot(engine, directory)
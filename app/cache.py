@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# "circuit_deletes" and "run_deletes" are only bumped when rows are deleted.
+# Caches whose entries are validated per row (by revision, or because the row
+# never changes) use them so other writes leave their entries in place, while
+# a deleted id that SQLite hands out again is still never served stale.
+CACHE_SCOPES = ("circuits", "runs", "sessions", "circuit_deletes", "run_deletes")
+
+_MISSING = object()
+
+
+class ScopedCache:
+    """Bounded in-process cache whose entries belong to one invalidation scope.
+
+    ``generation`` is bumped on every clear. Readers capture it before querying
+    the database and pass it back to ``set`` so a value read before a
+    concurrent invalidation is never stored afterwards.
+    """
+
+    def __init__(self, scope: str, maxsize: int = 1024) -> None:
+        if scope not in CACHE_SCOPES:
+            raise ValueError(f"Unknown cache scope: {scope}")
+        self.scope = scope
+        self.maxsize = maxsize
+        self.generation = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Like ``get`` but without refreshing the entry's recency."""
+        with self._lock:
+            return self._entries.get(key, default)
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def add(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        """Store ``value`` only if that does not evict another entry.
+
+        Scans over more rows than ``maxsize`` use ``peek`` and ``add`` so the
+        entries that fit stay cached; with ``get`` and ``set`` every entry
+        would be evicted before the next scan reached it again.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries or len(self._entries) < self.maxsize:
+                self._entries[key] = value
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+
+class CacheCoherence:
+    """Keeps in-process caches coherent across workers sharing one SQLite file.
+
+    Every write path bumps a per-scope counter in ``cache_generation`` inside
+    its own transaction. Readers call ``validate`` first: a dedicated
+    connection polls ``PRAGMA data_version``, which only changes when another
+    connection has committed, so the common case costs a single pragma and the
+    generation table is read only after a write somewhere.
+    """
+
+    def __init__(self, database_path: str) -> None:
+        self._database_path = database_path
+        self._lock = threading.Lock()
+        self._caches: Dict[str, list[ScopedCache]] = {scope: [] for scope in CACHE_SCOPES}
+        self._connection: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+        self._generations: Dict[str, int] = {}
+
+    @classmethod
+    def from_engine(cls, engine: Engine) -> "CacheCoherence":
+        return cls(engine.url.database or ":memory:")
+
+    def register(self, cache: ScopedCache) -> ScopedCache:
+        with self._lock:
+            self._caches[cache.scope].append(cache)
+        return cache
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self._database_path, check_same_thread=False, isolation_level=None
+            )
+        return self._connection
+
+    def _read_generations(self, connection: sqlite3.Connection) -> Dict[str, int]:
+        try:
+            rows = connection.execute("SELECT scope, generation FROM cache_generation")
+        except sqlite3.OperationalError:
+            return {}
+        return {scope: generation for scope, generation in rows}
+
+    def _invalidate(self, scopes: Iterable[str]) -> None:
+        for scope in scopes:
+            for cache in self._caches.get(scope, []):
+                cache.clear()
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._invalidate(CACHE_SCOPES)
+
+    def validate(self) -> None:
+        with self._lock:
+            connection = self._connect()
+            data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            generations = self._read_generations(connection)
+            if self._data_version is None:
+                changed: Iterable[str] = CACHE_SCOPES
+            else:
+                changed = [
+                    scope
+                    for scope in CACHE_SCOPES
+                    if generations.get(scope, 0) != self._generations.get(scope, 0)
+                ]
+            self._invalidate(changed)
+            self._data_version = data_version
+            self._generations = generations
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self._data_version = None
+
+
+def mark_changed(session, *scopes: str) -> None:
+    """Bump the generation of ``scopes`` in the caller's open transaction."""
+
+    for scope in scopes:
+        if scope not in CACHE_SCOPES:
+            raise ValueError(f"Unknown cache scope: {scope}")
+    if not scopes:
+        return
+    values = ", ".join(f"(:scope{index}, 1)" for index in range(len(scopes)))
+    session.execute(
+        text(
+            f"INSERT INTO cache_generation (scope, generation) VALUES {values} "
+            "ON CONFLICT(scope) DO UPDATE SET generation = generation + 1"
+        ),
+        {f"scope{index}": scope for index, scope in enumerate(scopes)},
+    )
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, List
+
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from .cache import mark_changed
+from .models import ChangeLogEntry
+
+# Entity name in the change log -> cache scope invalidated by the change.
+CHANGE_ENTITIES = {"circuit": "circuits", "run": "runs", "session": "sessions"}
+CHANGE_OPS = {"upsert", "delete"}
+# Extra scope bumped when an entity is deleted, see ``cache.CACHE_SCOPES``.
+DELETE_SCOPES = {"circuit": "circuit_deletes", "run": "run_deletes"}
+
+
+def record_changes(
+    session: Session, entity: str, entity_ids: Iterable[int], op: str = "upsert"
+) -> None:
+    """Log ``op`` for each entity in the caller's transaction.
+
+    The log keeps one row per entity: ``INSERT OR REPLACE`` drops the previous
+    row and the new one gets a fresh ``seq``, so catching up costs one row per
+    changed entity no matter how often it changed. Sessions are keyed by
+    their circuit id since a circuit has at most one.
+    """
+
+    if entity not in CHANGE_ENTITIES:
+        raise ValueError(f"Unknown change entity: {entity}")
+    if op not in CHANGE_OPS:
+        raise ValueError(f"Unknown change op: {op}")
+    now = datetime.utcnow()
+    rows = [
+        {"entity": entity, "entity_id": entity_id, "op": op, "changed_at": now}
+        for entity_id in entity_ids
+    ]
+    if not rows:
+        return
+    session.execute(insert(ChangeLogEntry).prefix_with("OR REPLACE"), rows)
+    scopes = [CHANGE_ENTITIES[entity]]
+    if op == "delete" and entity in DELETE_SCOPES:
+        scopes.append(DELETE_SCOPES[entity])
+    mark_changed(session, *scopes)
+
+
+def record_change(session: Session, entity: str, entity_id: int, op: str = "upsert") -> None:
+    record_changes(session, entity, [entity_id], op)
+
+
+def changes_since(session: Session, since: int, limit: int) -> List[ChangeLogEntry]:
+    return session.exec(
+        select(ChangeLogEntry)
+        .where(ChangeLogEntry.seq > since)
+        .order_by(ChangeLogEntry.seq)
+        .limit(limit)
+    ).all()
@@ -1,16 +1,42 @@
 from __future__ import annotations
 
+import os
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Iterator
 
+from sqlalchemy import event
 from sqlmodel import Session, create_engine
 
+from .cache import CacheCoherence
 from .migrations import run_migrations
+from .writer import WriteQueue
 
-DATABASE_URL = "sqlite:///" + str(Path(__file__).resolve().parent.parent / "circuits.db")
+DATABASE_URL = os.environ.get(
+    "CIRCUITS_DATABASE_URL",
+    "sqlite:///" + str(Path(__file__).resolve().parent.parent / "circuits.db"),
+)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Seconds a connection waits on another worker's write lock before failing.
+SQLITE_BUSY_TIMEOUT = 5
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+)
+
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record) -> None:
+    # WAL lets readers in every uvicorn worker proceed while one worker writes.
+    # ``synchronous`` keeps its FULL default so committed runs survive power loss.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+
+cache_coherence = CacheCoherence.from_engine(engine)
+write_queue = WriteQueue(engine)
 
 
 def init_db() -> None:
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("CIRCUITS_IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("CIRCUITS_IDEMPOTENCY_MAX_KEYS", "10000"))
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    """Raised when a key cannot be used for the current request."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _prune(session: Session, now: datetime) -> None:
+    session.execute(
+        delete(IdempotencyRecord).where(
+            IdempotencyRecord.created_at < now - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        )
+    )
+    overflow = (
+        select(IdempotencyRecord.key)
+        .order_by(IdempotencyRecord.created_at.desc())
+        .offset(IDEMPOTENCY_MAX_KEYS)
+        .scalar_subquery()
+    )
+    session.execute(delete(IdempotencyRecord).where(IdempotencyRecord.key.in_(overflow)))
+
+
+def reserve(session: Session, key: str, endpoint: str) -> IdempotencyRecord | None:
+    """Claim ``key`` for ``endpoint`` or return the response stored under it.
+
+    Returns ``None`` when the caller now owns the key and must call
+    ``complete`` in the same transaction; if the request fails instead, rolling
+    the transaction back frees the key. Returns the stored record when an
+    earlier request with the same key already finished.
+    """
+
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(
+            422, f"Idempotency-Key must be between 1 and {MAX_KEY_LENGTH} characters."
+        )
+
+    now = datetime.utcnow()
+    _prune(session, now)
+    existing = session.exec(select(IdempotencyRecord).where(IdempotencyRecord.key == key)).first()
+    if existing is not None:
+        if existing.endpoint != endpoint:
+            raise IdempotencyError(422, "Idempotency-Key was already used for a different request.")
+        return existing
+    session.add(IdempotencyRecord(key=key, endpoint=endpoint, created_at=now))
+    session.flush()
+    return None
+
+
+def complete(session: Session, key: str, status_code: int, body: bytes) -> None:
+    session.execute(
+        update(IdempotencyRecord)
+        .where(IdempotencyRecord.key == key)
+        .values(status_code=status_code, response_body=body)
+    )
@@ -1,25 +1,48 @@
 from __future__ import annotations
 
+import hmac
 import json
-from datetime import datetime, timezone
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, NamedTuple
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, Header, HTTPException, status
 from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import delete, insert, tuple_, update
 from sqlmodel import Session, select
-
-from .database import get_session, init_db
-from .models import Circuit, CircuitRun, CircuitRunSession, CircuitRunTask
+from starlette.background import BackgroundTask
+
+from . import backup, changelog, idempotency, query_budget
+from .cache import ScopedCache
+from .changelog import record_change, record_changes
+from .database import cache_coherence, engine, get_session, init_db, write_queue
+from .models import (
+    ChangeLogEntry,
+    Circuit,
+    CircuitRun,
+    CircuitRunSession,
+    CircuitRunTask,
+    CircuitTask,
+)
+from .scheduler import PeriodicTask
+from .writer import WriteFunc
 
 BASE_DIR = Path(__file__).resolve().parent
 SPA_DIR = BASE_DIR / "static"
 SPA_INDEX = SPA_DIR / "index.html"
 SPA_ASSETS_DIR = SPA_DIR / "assets"
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Circuits", description="Create, edit, and run timeboxed circuits.")
 
+query_budget.install(app, engine)
+
 if SPA_ASSETS_DIR.exists():
     app.mount("/assets", StaticFiles(directory=SPA_ASSETS_DIR), name="spa-assets")
 
@@ -27,6 +50,61 @@ if SPA_ASSETS_DIR.exists():
 TASK_STATUS_VALUES = {"completed", "skipped", "not_done"}
 SESSION_STATUS_VALUES = {"paused", "in_progress"}
 SESSION_TASK_STATUS_VALUES = TASK_STATUS_VALUES | {"pending"}
+MAX_TASK_PAGE_SIZE = 1000
+SYNC_PAGE_SIZE = 200
+MAX_SYNC_PAGE_SIZE = 1000
+
+# In-progress sessions untouched for this long are considered abandoned.
+# "finalize" records them as runs, "expire" deletes them, "off" disables
+# the background sweep; the admin endpoint then finalizes unless told otherwise.
+SESSION_SWEEP_POLICY = os.environ.get("CIRCUITS_SESSION_SWEEP_POLICY", "finalize")
+SESSION_SWEEP_INTERVAL_SECONDS = int(
+    os.environ.get("CIRCUITS_SESSION_SWEEP_INTERVAL_SECONDS", "300")
+)
+SESSION_STALE_AFTER_SECONDS = int(
+    os.environ.get("CIRCUITS_SESSION_STALE_AFTER_SECONDS", str(6 * 60 * 60))
+)
+# A running task only saves the session when it changes state, so anything
+# shorter would sweep sessions that are still being run.
+SESSION_MIN_STALE_AFTER_SECONDS = 15 * 60
+SESSION_SWEEP_BATCH_SIZE = 100
+SESSION_SWEEP_POLICIES = {"finalize", "expire", "off"}
+
+# Bearer token for /api/admin/*. The admin endpoints are disabled when unset.
+ADMIN_TOKEN = os.environ.get("CIRCUITS_ADMIN_TOKEN", "")
+
+
+class SessionVersionConflict(Exception):
+    """Raised when a session patch was built against an outdated version."""
+
+    def __init__(self, current_version: int | None) -> None:
+        super().__init__("Session was modified by another client.")
+        self.current_version = current_version
+
+
+class CircuitRef(NamedTuple):
+    """The columns of a circuit that circuit-scoped handlers need most often."""
+
+    id: int
+    revision: int
+    name: str
+    task_count: int
+
+
+circuit_index = cache_coherence.register(ScopedCache("circuits", maxsize=4096))
+# Encoded JSON keyed by id and stored with the circuit revision it was built
+# from. Circuit fragments omit "active_run" and the closing brace so the
+# per-request session state can be appended without re-encoding the tasks.
+# Entries are checked against the revision on read and popped when their row
+# is deleted, so only deletes clear these caches across workers. Each holds
+# at most FRAGMENT_CACHE_SIZE entries per worker.
+FRAGMENT_CACHE_SIZE = int(os.environ.get("CIRCUITS_FRAGMENT_CACHE_SIZE", "4096"))
+circuit_fragments = cache_coherence.register(
+    ScopedCache("circuit_deletes", maxsize=FRAGMENT_CACHE_SIZE)
+)
+run_fragments = cache_coherence.register(
+    ScopedCache("run_deletes", maxsize=FRAGMENT_CACHE_SIZE)
+)
 
 
 def format_datetime(value: datetime | None) -> str | None:
@@ -62,28 +140,51 @@ def parse_optional_iso_datetime(raw: Any, field_name: str) -> datetime | None:
     return parse_iso_datetime(raw, field_name)
 
 
+def parse_session_task_status(value: Any) -> str:
+    if not isinstance(value, str):
+        raise ValueError("Each task status must be a string.")
+    normalized = value.strip().lower()
+    if normalized not in SESSION_TASK_STATUS_VALUES:
+        raise ValueError(
+            "Task status must be one of pending, completed, skipped, or not_done."
+        )
+    return normalized
+
+
 def parse_session_task_statuses(raw: Any, expected_length: int) -> list[str]:
     if not isinstance(raw, list):
         raise ValueError("task_statuses must be an array.")
     if expected_length >= 0 and len(raw) != expected_length:
         raise ValueError("task_statuses length must match the number of circuit tasks.")
-    statuses: list[str] = []
-    for value in raw:
-        if not isinstance(value, str):
-            raise ValueError("Each task status must be a string.")
-        normalized = value.strip().lower()
-        if normalized not in SESSION_TASK_STATUS_VALUES:
-            raise ValueError(
-                "Task status must be one of pending, completed, skipped, or not_done."
-            )
-        statuses.append(normalized)
-    return statuses
+    return [parse_session_task_status(value) for value in raw]
+
+
+def parse_session_status(raw: Any) -> str:
+    if raw not in SESSION_STATUS_VALUES:
+        raise ValueError("status must be either paused or in_progress.")
+    return raw
+
+
+def parse_current_index(raw: Any, task_count: int) -> int:
+    if not isinstance(raw, int) or raw < 0:
+        raise ValueError("current_index must be a non-negative integer.")
+    if raw > task_count:
+        raise ValueError("current_index cannot exceed the number of tasks.")
+    return raw
+
+
+def parse_seconds(raw: Any, field_name: str) -> int:
+    try:
+        value = int(raw)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"{field_name} must be an integer.") from exc
+    return max(value, 0)
 
 
 def serialize_run_model(
     run: CircuitRun,
     tasks: List[CircuitRunTask] | None = None,
-    circuit: Circuit | None = None,
+    circuit: Circuit | CircuitRef | None = None,
 ) -> Dict[str, Any]:
     total = run.total_duration_seconds or 0
     completed = run.completed_duration_seconds or 0
@@ -146,24 +247,67 @@ def serialize_session_model(session_model: CircuitRunSession) -> Dict[str, Any]:
         "elapsed_seconds": max(elapsed, 0),
         "elapsed_seconds_base": max(session_model.elapsed_seconds or 0, 0),
         "task_statuses": statuses_raw,
+        "version": session_model.version,
         "updated_at": format_datetime(session_model.updated_at),
         "created_at": format_datetime(session_model.created_at),
     }
 
 
 def serialize_circuit_model(
-    circuit: Circuit, active_run: CircuitRunSession | None = None
+    circuit: Circuit,
+    active_run: CircuitRunSession | None = None,
+    tasks: List[Dict[str, Any]] | None = None,
 ) -> Dict[str, Any]:
     return {
         "id": circuit.id,
         "name": circuit.name,
         "description": circuit.description,
         "created_at": format_datetime(circuit.created_at),
-        "tasks": circuit.tasks(),
+        "task_count": circuit.task_count,
+        "tasks": tasks,
         "active_run": serialize_session_model(active_run) if active_run else None,
     }
 
 
+def encode_json(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_circuit_fragment(circuit: Circuit, tasks: List[Dict[str, Any]]) -> bytes:
+    data = serialize_circuit_model(circuit, tasks=tasks)
+    del data["active_run"]
+    return encode_json(data)[:-1]
+
+
+def render_circuit_fragment(
+    fragment: bytes, active_run: CircuitRunSession | None
+) -> bytes:
+    session_data = serialize_session_model(active_run) if active_run else None
+    return fragment + b',"active_run":' + encode_json(session_data) + b"}"
+
+
+def json_bytes_response(content: bytes, status_code: int = status.HTTP_200_OK) -> Response:
+    return Response(content=content, status_code=status_code, media_type="application/json")
+
+
+def replay_or_reserve(
+    session: Session, idempotency_key: str | None, endpoint: str
+) -> Response | None:
+    """Return the stored response for a repeated key, or claim a new key."""
+
+    if idempotency_key is None:
+        return None
+    try:
+        record = idempotency.reserve(session, idempotency_key, endpoint)
+    except idempotency.IdempotencyError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
+    if record is None:
+        return None
+    response = json_bytes_response(record.response_body or b"", record.status_code)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
 def validate_circuit_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     if not isinstance(payload, dict):
         raise ValueError("Circuit payload must be a JSON object.")
@@ -177,58 +321,237 @@ def validate_circuit_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     if not isinstance(tasks, list) or not tasks:
         raise ValueError("Circuit must include a non-empty list of tasks.")
 
-    normalized_tasks = []
-    for task in tasks:
-        if not isinstance(task, dict):
-            raise ValueError("Each task must be an object.")
-        task_name = task.get("name")
-        task_desc = task.get("description", "")
-        duration = task.get("duration")
-        if not task_name or not isinstance(task_name, str):
-            raise ValueError("Task name is required.")
-        if not isinstance(task_desc, str):
-            raise ValueError("Task description must be a string.")
-        try:
-            duration_value = int(duration)
-        except (TypeError, ValueError):
-            raise ValueError("Task duration must be an integer.")
-        if duration_value <= 0:
-            raise ValueError("Task duration must be greater than zero.")
-        normalized_tasks.append(
-            {
-                "name": task_name,
-                "description": task_desc,
-                "duration": duration_value,
-            }
-        )
-
+    normalized_tasks = [validate_task_payload(task) for task in tasks]
     return {"name": name, "description": description, "tasks": normalized_tasks}
 
 
+def validate_task_payload(task: Any) -> Dict[str, Any]:
+    if not isinstance(task, dict):
+        raise ValueError("Each task must be an object.")
+    task_name = task.get("name")
+    task_desc = task.get("description", "")
+    duration = task.get("duration")
+    if not task_name or not isinstance(task_name, str):
+        raise ValueError("Task name is required.")
+    if not isinstance(task_desc, str):
+        raise ValueError("Task description must be a string.")
+    try:
+        duration_value = int(duration)
+    except (TypeError, ValueError):
+        raise ValueError("Task duration must be an integer.")
+    if duration_value <= 0:
+        raise ValueError("Task duration must be greater than zero.")
+    return {
+        "name": task_name,
+        "description": task_desc,
+        "duration": duration_value,
+    }
+
+
 @app.on_event("startup")
 def on_startup() -> None:
+    # Fail the worker now rather than logging the same error every sweep.
+    try:
+        check_sweep_settings(SESSION_SWEEP_POLICY, SESSION_STALE_AFTER_SECONDS)
+    except ValueError as exc:
+        raise RuntimeError(
+            "Invalid CIRCUITS_SESSION_SWEEP_POLICY or "
+            f"CIRCUITS_SESSION_STALE_AFTER_SECONDS: {exc}"
+        ) from exc
     init_db()
+    write_queue.start()
+    if SESSION_SWEEP_POLICY != "off":
+        session_sweeper.start()
+    backup_scheduler.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    session_sweeper.stop()
+    backup_scheduler.stop()
+    write_queue.stop()
+
+
+backup_scheduler = PeriodicTask(
+    "database-backup",
+    backup.BACKUP_INTERVAL_SECONDS,
+    lambda: backup.run_scheduled_backup(engine),
+)
+
+
+def load_circuit_tasks(
+    session: Session, circuit_id: int, offset: int = 0, limit: int | None = None
+) -> List[Dict[str, Any]]:
+    statement = (
+        select(CircuitTask)
+        .where(CircuitTask.circuit_id == circuit_id, CircuitTask.position >= offset)
+        .order_by(CircuitTask.position)
+    )
+    if limit is not None:
+        statement = statement.where(CircuitTask.position < offset + limit)
+    return [task.as_payload() for task in session.exec(statement)]
+
+
+def load_tasks_for_circuits(
+    session: Session, circuit_ids: List[int]
+) -> Dict[int, List[Dict[str, Any]]]:
+    tasks_map: Dict[int, List[Dict[str, Any]]] = {circuit_id: [] for circuit_id in circuit_ids}
+    if not circuit_ids:
+        return tasks_map
+    rows = session.exec(
+        select(CircuitTask)
+        .where(CircuitTask.circuit_id.in_(circuit_ids))
+        .order_by(CircuitTask.circuit_id, CircuitTask.position)
+    )
+    for task in rows:
+        tasks_map[task.circuit_id].append(task.as_payload())
+    return tasks_map
+
+
+def _insert_circuit_tasks(
+    session: Session, circuit_id: int, start: int, tasks: List[Dict[str, Any]]
+) -> None:
+    if not tasks:
+        return
+    session.execute(
+        insert(CircuitTask),
+        [
+            {"circuit_id": circuit_id, "position": start + offset, **task}
+            for offset, task in enumerate(tasks)
+        ],
+    )
 
 
 def create_or_update_circuit(session: Session, circuit: Circuit | None, payload: Dict[str, Any]) -> Circuit:
     normalized = validate_circuit_payload(payload)
-    tasks_json = json.dumps(normalized["tasks"], ensure_ascii=False)
     if circuit is None:
         circuit = Circuit(
             name=normalized["name"],
             description=normalized["description"],
-            tasks_json=tasks_json,
+            task_count=len(normalized["tasks"]),
         )
         session.add(circuit)
+        session.flush()
     else:
         circuit.name = normalized["name"]
         circuit.description = normalized["description"]
-        circuit.tasks_json = tasks_json
-    session.commit()
-    session.refresh(circuit)
+        circuit.task_count = len(normalized["tasks"])
+        circuit.revision = (circuit.revision or 0) + 1
+        session.execute(delete(CircuitTask).where(CircuitTask.circuit_id == circuit.id))
+    _insert_circuit_tasks(session, circuit.id, 0, normalized["tasks"])
+    record_change(session, "circuit", circuit.id)
+    circuit_fragments.pop(circuit.id)
+    session.flush()
     return circuit
 
 
+def splice_circuit_tasks(
+    session: Session, circuit: Circuit, payload: Dict[str, Any]
+) -> tuple[Circuit, CircuitRunSession | None]:
+    """Replace ``delete_count`` tasks starting at ``offset`` with ``tasks``.
+
+    Only the rows in the edited range are rewritten; when the task count
+    changes the tail is renumbered with a single UPDATE. An active run
+    session is spliced the same way: replaced tasks become ``pending`` and
+    its current index follows the task it pointed at. Returns the circuit
+    and the updated session, if any.
+    """
+
+    if circuit.id is None:
+        raise ValueError("Circuit must be persisted before editing tasks.")
+    if not isinstance(payload, dict):
+        raise ValueError("Task edit payload must be a JSON object.")
+
+    offset = payload.get("offset")
+    delete_count = payload.get("delete_count", 0)
+    tasks_payload = payload.get("tasks", [])
+    if not isinstance(offset, int) or offset < 0 or offset > circuit.task_count:
+        raise ValueError("offset must be an index within the circuit tasks.")
+    if not isinstance(delete_count, int) or delete_count < 0:
+        raise ValueError("delete_count must be a non-negative integer.")
+    if offset + delete_count > circuit.task_count:
+        raise ValueError("delete_count extends past the end of the circuit tasks.")
+    if not isinstance(tasks_payload, list):
+        raise ValueError("tasks must be an array.")
+    new_tasks = [validate_task_payload(task) for task in tasks_payload]
+    new_count = circuit.task_count - delete_count + len(new_tasks)
+    if new_count <= 0:
+        raise ValueError("Circuit must include a non-empty list of tasks.")
+
+    end = offset + delete_count
+    shift = len(new_tasks) - delete_count
+    circuit.revision = (circuit.revision or 0) + 1
+    circuit.task_count = new_count
+    if shift == 0:
+        existing_ids = session.exec(
+            select(CircuitTask.id)
+            .where(
+                CircuitTask.circuit_id == circuit.id,
+                CircuitTask.position >= offset,
+                CircuitTask.position < end,
+            )
+            .order_by(CircuitTask.position)
+        ).all()
+        if existing_ids:
+            session.execute(
+                update(CircuitTask),
+                [
+                    {"id": task_id, **task}
+                    for task_id, task in zip(existing_ids, new_tasks)
+                ],
+            )
+    else:
+        session.execute(
+            delete(CircuitTask).where(
+                CircuitTask.circuit_id == circuit.id,
+                CircuitTask.position >= offset,
+                CircuitTask.position < end,
+            )
+        )
+        session.execute(
+            update(CircuitTask)
+            .where(CircuitTask.circuit_id == circuit.id, CircuitTask.position >= end)
+            .values(position=CircuitTask.position + shift)
+        )
+        _insert_circuit_tasks(session, circuit.id, offset, new_tasks)
+
+    session_model = get_circuit_session(session, circuit.id)
+    if session_model is not None:
+        try:
+            statuses = json.loads(session_model.task_statuses_json)
+        except json.JSONDecodeError:
+            statuses = []
+        if isinstance(statuses, list):
+            statuses[offset:end] = ["pending"] * len(new_tasks)
+            session_model.task_statuses_json = json.dumps(statuses, ensure_ascii=False)
+        index = session_model.current_task_index
+        if index >= end:
+            session_model.current_task_index = index + shift
+        elif index >= offset:
+            # The current task itself was replaced: start over on whichever
+            # task now sits at ``offset`` with its full duration.
+            session_model.current_task_index = min(offset, new_count)
+            if new_tasks:
+                session_model.remaining_seconds = new_tasks[0]["duration"]
+            else:
+                duration = session.exec(
+                    select(CircuitTask.duration).where(
+                        CircuitTask.circuit_id == circuit.id,
+                        CircuitTask.position == offset,
+                    )
+                ).first()
+                session_model.remaining_seconds = duration or 0
+        session_model.current_task_index = min(session_model.current_task_index, new_count)
+        session_model.version = (session_model.version or 0) + 1
+        session_model.updated_at = datetime.utcnow()
+        record_change(session, "session", circuit.id)
+
+    record_change(session, "circuit", circuit.id)
+    circuit_fragments.pop(circuit.id)
+    session.flush()
+    return circuit, session_model
+
+
 def get_circuit_session(session: Session, circuit_id: int) -> CircuitRunSession | None:
     return session.exec(
         select(CircuitRunSession).where(CircuitRunSession.circuit_id == circuit_id)
@@ -236,7 +559,7 @@ def get_circuit_session(session: Session, circuit_id: int) -> CircuitRunSession
 
 
 def upsert_circuit_session(
-    session: Session, circuit: Circuit, payload: Dict[str, Any]
+    session: Session, circuit: Circuit | CircuitRef, payload: Dict[str, Any]
 ) -> CircuitRunSession:
     if circuit.id is None:
         raise ValueError("Circuit must be persisted before updating a session.")
@@ -244,34 +567,15 @@ def upsert_circuit_session(
     if not isinstance(payload, dict):
         raise ValueError("Session payload must be a JSON object.")
 
-    tasks = circuit.tasks()
-    statuses = parse_session_task_statuses(payload.get("task_statuses"), len(tasks))
-
-    status = payload.get("status", "paused")
-    if status not in SESSION_STATUS_VALUES:
-        raise ValueError("status must be either paused or in_progress.")
-
-    current_index = payload.get("current_index", 0)
-    if not isinstance(current_index, int) or current_index < 0:
-        raise ValueError("current_index must be a non-negative integer.")
-    if current_index > len(tasks):
-        raise ValueError("current_index cannot exceed the number of tasks.")
+    task_count = circuit.task_count
+    statuses = parse_session_task_statuses(payload.get("task_statuses"), task_count)
 
-    remaining_seconds_raw = payload.get("remaining_seconds", 0)
-    try:
-        remaining_seconds = int(remaining_seconds_raw)
-    except (TypeError, ValueError) as exc:
-        raise ValueError("remaining_seconds must be an integer.") from exc
-    if remaining_seconds < 0:
-        remaining_seconds = 0
-
-    elapsed_raw = payload.get("elapsed_seconds", 0)
-    try:
-        elapsed_seconds = int(elapsed_raw)
-    except (TypeError, ValueError) as exc:
-        raise ValueError("elapsed_seconds must be an integer.") from exc
-    if elapsed_seconds < 0:
-        elapsed_seconds = 0
+    status = parse_session_status(payload.get("status", "paused"))
+    current_index = parse_current_index(payload.get("current_index", 0), task_count)
+    remaining_seconds = parse_seconds(
+        payload.get("remaining_seconds", 0), "remaining_seconds"
+    )
+    elapsed_seconds = parse_seconds(payload.get("elapsed_seconds", 0), "elapsed_seconds")
 
     has_started = bool(payload.get("has_started", False))
     running = bool(payload.get("running", False))
@@ -288,13 +592,40 @@ def upsert_circuit_session(
     elif last_started_at is None:
         last_started_at = datetime.utcnow()
 
+    # ``version`` is optional here; when given, the replace only applies to
+    # that version of the stored session, like a PATCH.
+    expected_version = payload.get("version")
+    if expected_version is not None and (
+        not isinstance(expected_version, int) or isinstance(expected_version, bool)
+    ):
+        raise ValueError("version must be an integer.")
+
     instance = get_circuit_session(session, circuit.id)
+    if expected_version is not None and (
+        instance is None or instance.version != expected_version
+    ):
+        raise SessionVersionConflict(instance.version if instance else None)
     if instance is None:
         instance = CircuitRunSession(circuit_id=circuit.id)
         session.add(instance)
+    elif expected_version is not None:
+        claimed = session.execute(
+            update(CircuitRunSession)
+            .where(
+                CircuitRunSession.id == instance.id,
+                CircuitRunSession.version == expected_version,
+            )
+            .values(version=expected_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount != 1:
+            raise SessionVersionConflict(None)
+        instance.version = expected_version + 1
+    else:
+        instance.version = (instance.version or 0) + 1
 
     instance.status = status
-    instance.current_task_index = min(current_index, len(tasks))
+    instance.current_task_index = min(current_index, task_count)
     instance.remaining_seconds = remaining_seconds
     instance.has_started = has_started
     instance.running = running
@@ -304,7 +635,101 @@ def upsert_circuit_session(
     instance.task_statuses_json = json.dumps(statuses, ensure_ascii=False)
     instance.updated_at = datetime.utcnow()
 
-    session.commit()
+    record_change(session, "session", circuit.id)
+    session.flush()
+    return instance
+
+
+def patch_circuit_session(
+    session: Session, circuit_id: int, payload: Dict[str, Any]
+) -> CircuitRunSession | None:
+    """Apply a partial update to the stored session.
+
+    Only the fields present in ``payload`` are validated and written, and
+    ``task_statuses`` is an object of ``{index: status}`` entries. The caller
+    must send the ``version`` it last saw; the update is applied with a
+    compare-and-swap on that version so concurrent writers cannot clobber
+    each other.
+    """
+
+    if not isinstance(payload, dict):
+        raise ValueError("Session payload must be a JSON object.")
+    expected_version = payload.get("version")
+    if not isinstance(expected_version, int) or isinstance(expected_version, bool):
+        raise ValueError("version is required to patch a session.")
+
+    instance = get_circuit_session(session, circuit_id)
+    if instance is None:
+        return None
+    if instance.version != expected_version:
+        raise SessionVersionConflict(instance.version)
+
+    changes: Dict[str, Any] = {}
+    statuses: list[str] | None = None
+
+    def stored_statuses() -> list[str]:
+        nonlocal statuses
+        if statuses is None:
+            try:
+                statuses = json.loads(instance.task_statuses_json)
+            except json.JSONDecodeError as exc:
+                raise ValueError("Stored task statuses are invalid.") from exc
+            if not isinstance(statuses, list):
+                raise ValueError("Stored task statuses are invalid.")
+        return statuses
+
+    status_updates = payload.get("task_statuses")
+    if status_updates is not None:
+        if not isinstance(status_updates, dict):
+            raise ValueError("task_statuses must be an object of task index to status.")
+        current = stored_statuses()
+        for raw_index, raw_status in status_updates.items():
+            try:
+                index = int(raw_index)
+            except (TypeError, ValueError) as exc:
+                raise ValueError("Task status keys must be task indexes.") from exc
+            if index < 0 or index >= len(current):
+                raise ValueError("Task index is out of range for this circuit.")
+            current[index] = parse_session_task_status(raw_status)
+        changes["task_statuses_json"] = json.dumps(current, ensure_ascii=False)
+
+    if "status" in payload:
+        changes["status"] = parse_session_status(payload["status"])
+    if "current_index" in payload:
+        changes["current_task_index"] = parse_current_index(
+            payload["current_index"], len(stored_statuses())
+        )
+    for field in ("remaining_seconds", "elapsed_seconds"):
+        if field in payload:
+            changes[field] = parse_seconds(payload[field], field)
+    for field in ("has_started", "running"):
+        if field in payload:
+            changes[field] = bool(payload[field])
+    for field in ("run_started_at", "last_started_at"):
+        if field in payload:
+            changes[field] = parse_optional_iso_datetime(payload[field], field)
+
+    if "status" in changes or "last_started_at" in changes:
+        if changes.get("status", instance.status) == "paused":
+            changes["last_started_at"] = None
+        elif changes.get("last_started_at", instance.last_started_at) is None:
+            changes["last_started_at"] = datetime.utcnow()
+
+    changes["version"] = expected_version + 1
+    changes["updated_at"] = datetime.utcnow()
+    result = session.execute(
+        update(CircuitRunSession)
+        .where(
+            CircuitRunSession.id == instance.id,
+            CircuitRunSession.version == expected_version,
+        )
+        .values(**changes)
+    )
+    if result.rowcount != 1:
+        current = get_circuit_session(session, circuit_id)
+        raise SessionVersionConflict(current.version if current else None)
+
+    record_change(session, "session", circuit_id)
     session.refresh(instance)
     return instance
 
@@ -314,18 +739,33 @@ def remove_circuit_session(session: Session, circuit_id: int) -> bool:
     if instance is None:
         return False
     session.delete(instance)
-    session.commit()
+    record_change(session, "session", circuit_id, "delete")
     return True
 
 
+def session_task_results(statuses: List[str], skip_incomplete: bool = False) -> List[Dict[str, Any]]:
+    """Turn stored session statuses into the task results of a run."""
+
+    results: List[Dict[str, Any]] = []
+    for index, status in enumerate(statuses):
+        normalized = status
+        if normalized not in TASK_STATUS_VALUES:
+            normalized = "completed" if status == "completed" else "not_done"
+        if normalized == "not_done" and status == "pending":
+            normalized = "not_done"
+        if skip_incomplete and normalized != "completed":
+            normalized = "skipped"
+        results.append({"index": index, "status": normalized})
+    return results
+
+
 def finalize_circuit_session(
-    session: Session, circuit: Circuit, payload: Dict[str, Any]
+    session: Session, circuit: Circuit | CircuitRef, payload: Dict[str, Any]
 ) -> tuple[CircuitRun, List[CircuitRunTask]]:
     if circuit.id is None:
         raise ValueError("Circuit must be persisted before finalizing a run.")
 
-    tasks = circuit.tasks()
-    if not tasks:
+    if circuit.task_count <= 0:
         raise ValueError("Circuit must include tasks before recording a run.")
 
     session_model = get_circuit_session(session, circuit.id)
@@ -339,19 +779,11 @@ def finalize_circuit_session(
         except json.JSONDecodeError as exc:
             raise ValueError("Stored task statuses are invalid.") from exc
 
-    statuses = parse_session_task_statuses(statuses_payload, len(tasks))
+    statuses = parse_session_task_statuses(statuses_payload, circuit.task_count)
 
-    skip_incomplete = bool(payload.get("skip_incomplete", False))
-    normalized_statuses: List[Dict[str, Any]] = []
-    for index, status in enumerate(statuses):
-        normalized = status
-        if normalized not in TASK_STATUS_VALUES:
-            normalized = "completed" if status == "completed" else "not_done"
-        if normalized == "not_done" and status == "pending":
-            normalized = "not_done"
-        if skip_incomplete and normalized != "completed":
-            normalized = "skipped"
-        normalized_statuses.append({"index": index, "status": normalized})
+    normalized_statuses = session_task_results(
+        statuses, bool(payload.get("skip_incomplete", False))
+    )
 
     started_at = parse_optional_iso_datetime(payload.get("started_at"), "started_at")
     ended_at = parse_optional_iso_datetime(payload.get("ended_at"), "ended_at")
@@ -372,26 +804,199 @@ def finalize_circuit_session(
     run, task_models = record_circuit_run(session, circuit, run_payload)
 
     if session_model is not None:
-        session.delete(session_model)
-        session.commit()
-        session.refresh(run)
+        session.execute(
+            delete(CircuitRunSession).where(CircuitRunSession.id == session_model.id)
+        )
+        record_change(session, "session", circuit.id, "delete")
 
     return run, task_models
 
 
-def record_circuit_run(
-    session: Session, circuit: Circuit, payload: Dict[str, Any]
-) -> tuple[CircuitRun, List[CircuitRunTask]]:
-    if circuit.id is None:
-        raise ValueError("Circuit must be persisted before recording runs.")
-    if not isinstance(payload, dict):
-        raise ValueError("Run payload must be a JSON object.")
+class StaleSession(NamedTuple):
+    id: int
+    circuit_id: int
+    version: int
+    started_at: datetime
+    ended_at: datetime
+    task_statuses_json: str
+
+
+def _sweep_batch(policy: str, batch: List[StaleSession]) -> WriteFunc:
+    """Finalize or expire ``batch`` with a fixed number of statements."""
+
+    def sweep(session: Session) -> Dict[str, int]:
+        # Bumping the version first means only one worker wins a given
+        # session, and a client heartbeat that landed since the batch was
+        # read makes the sweep skip it.
+        claimed_ids = set(
+            session.execute(
+                update(CircuitRunSession)
+                .where(
+                    tuple_(CircuitRunSession.id, CircuitRunSession.version).in_(
+                        [(row.id, row.version) for row in batch]
+                    )
+                )
+                .values(version=CircuitRunSession.version + 1)
+                .returning(CircuitRunSession.id)
+                .execution_options(synchronize_session=False)
+            ).scalars()
+        )
+        claimed = [row for row in batch if row.id in claimed_ids]
+        if not claimed:
+            return {"finalized": 0, "expired": 0}
+
+        run_rows: List[Dict[str, Any]] = []
+        run_results: List[List[Dict[str, Any]]] = []
+        if policy == "finalize":
+            circuit_ids = list(
+                session.exec(
+                    select(Circuit.id).where(
+                        Circuit.id.in_({row.circuit_id for row in claimed})
+                    )
+                )
+            )
+            tasks_map = load_tasks_for_circuits(session, circuit_ids)
+            for row in claimed:
+                circuit_tasks = tasks_map.get(row.circuit_id)
+                if not circuit_tasks:
+                    continue
+                try:
+                    statuses = parse_session_task_statuses(
+                        json.loads(row.task_statuses_json), len(circuit_tasks)
+                    )
+                    results, total, completed = build_run_tasks(
+                        circuit_tasks, session_task_results(statuses)
+                    )
+                except (ValueError, json.JSONDecodeError):
+                    continue
+                run_rows.append(
+                    {
+                        "circuit_id": row.circuit_id,
+                        "started_at": min(row.started_at, row.ended_at),
+                        "ended_at": row.ended_at,
+                        "total_duration_seconds": total,
+                        "completed_duration_seconds": completed,
+                    }
+                )
+                run_results.append(results)
+
+        if run_rows:
+            # One multi-row INSERT under the write lock assigns consecutive
+            # ids in parameter order; asking SQLAlchemy to guarantee that
+            # order would make it fall back to one INSERT per run on SQLite.
+            run_ids = sorted(
+                session.execute(insert(CircuitRun).returning(CircuitRun.id), run_rows).scalars()
+            )
+            session.execute(
+                insert(CircuitRunTask),
+                [
+                    task_row
+                    for run_id, results in zip(run_ids, run_results)
+                    for task_row in _run_task_rows(run_id, results)
+                ],
+            )
+            record_changes(session, "run", run_ids)
 
-    circuit_tasks = circuit.tasks()
-    if not circuit_tasks:
-        raise ValueError("Circuit must have tasks to record a run.")
+        session.execute(delete(CircuitRunSession).where(CircuitRunSession.id.in_(claimed_ids)))
+        record_changes(session, "session", [row.circuit_id for row in claimed], "delete")
+        return {"finalized": len(run_rows), "expired": len(claimed) - len(run_rows)}
+
+    return sweep
+
+
+def check_sweep_settings(policy: str, stale_after_seconds: int) -> None:
+    if policy not in SESSION_SWEEP_POLICIES:
+        raise ValueError("policy must be one of finalize, expire, or off.")
+    if stale_after_seconds < SESSION_MIN_STALE_AFTER_SECONDS:
+        raise ValueError(
+            f"stale_after_seconds must be at least {SESSION_MIN_STALE_AFTER_SECONDS}."
+        )
+
+
+def sweep_stale_sessions(
+    policy: str = SESSION_SWEEP_POLICY,
+    stale_after_seconds: int = SESSION_STALE_AFTER_SECONDS,
+    batch_size: int = SESSION_SWEEP_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """Finalize or expire in-progress sessions with no update since the cutoff.
+
+    Finalized runs end at the session's last update rather than now, so a
+    forgotten tab does not inflate the recorded run. Sessions that cannot be
+    finalized (their circuit is gone or their statuses no longer fit) are
+    expired instead.
+    """
+
+    check_sweep_settings(policy, stale_after_seconds)
+    report: Dict[str, Any] = {"policy": policy, "finalized": 0, "expired": 0}
+    if policy == "off":
+        return report
+
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after_seconds)
+    last_seen: tuple[datetime, int] | None = None
+    with get_session() as session:
+        while True:
+            statement = (
+                select(CircuitRunSession)
+                .where(
+                    CircuitRunSession.updated_at < cutoff,
+                    CircuitRunSession.status == "in_progress",
+                )
+                .order_by(CircuitRunSession.updated_at, CircuitRunSession.id)
+                .limit(batch_size)
+            )
+            if last_seen is not None:
+                statement = statement.where(
+                    (CircuitRunSession.updated_at > last_seen[0])
+                    | (
+                        (CircuitRunSession.updated_at == last_seen[0])
+                        & (CircuitRunSession.id > last_seen[1])
+                    )
+                )
+            batch = [
+                StaleSession(
+                    model.id,
+                    model.circuit_id,
+                    model.version,
+                    model.run_started_at or model.created_at,
+                    model.updated_at,
+                    model.task_statuses_json,
+                )
+                for model in session.exec(statement)
+            ]
+            session.expunge_all()
+            if not batch:
+                break
+            last_seen = (batch[-1].ended_at, batch[-1].id)
+
+            outcome = write_queue.run(_sweep_batch(policy, batch))
+            report["finalized"] += outcome["finalized"]
+            report["expired"] += outcome["expired"]
+            if len(batch) < batch_size:
+                break
+
+    if report["finalized"] or report["expired"]:
+        logger.info(
+            "Swept stale run sessions: %s finalized, %s expired",
+            report["finalized"],
+            report["expired"],
+        )
+    return report
+
+
+session_sweeper = PeriodicTask(
+    "session-sweeper", SESSION_SWEEP_INTERVAL_SECONDS, sweep_stale_sessions
+)
+
+
+def build_run_tasks(
+    circuit_tasks: List[Dict[str, Any]], tasks_payload: Any
+) -> tuple[List[Dict[str, Any]], int, int]:
+    """Validate task results against ``circuit_tasks``.
+
+    Returns one normalized row per circuit task plus the total and completed
+    durations.
+    """
 
-    tasks_payload = payload.get("tasks")
     if not isinstance(tasks_payload, list):
         raise ValueError("Run payload must include a tasks array.")
 
@@ -409,11 +1014,6 @@ def record_circuit_run(
             raise ValueError("Task status must be one of completed, skipped, or not_done.")
         status_map[index] = status
 
-    started_at = parse_iso_datetime(payload.get("started_at"), "started_at")
-    ended_at = parse_iso_datetime(payload.get("ended_at"), "ended_at")
-    if ended_at < started_at:
-        raise ValueError("ended_at cannot be before started_at.")
-
     total_duration = 0
     completed_duration = 0
     normalized_results: List[Dict[str, Any]] = []
@@ -440,6 +1040,43 @@ def record_circuit_run(
                 "status": status,
             }
         )
+    return normalized_results, total_duration, completed_duration
+
+
+def _run_task_rows(run_id: int, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "run_id": run_id,
+            "task_index": item["index"],
+            "name": item["name"],
+            "description": item["description"],
+            "duration": item["duration"],
+            "status": item["status"],
+        }
+        for item in results
+    ]
+
+
+def record_circuit_run(
+    session: Session, circuit: Circuit | CircuitRef, payload: Dict[str, Any]
+) -> tuple[CircuitRun, List[CircuitRunTask]]:
+    if circuit.id is None:
+        raise ValueError("Circuit must be persisted before recording runs.")
+    if not isinstance(payload, dict):
+        raise ValueError("Run payload must be a JSON object.")
+
+    circuit_tasks = load_circuit_tasks(session, circuit.id)
+    if not circuit_tasks:
+        raise ValueError("Circuit must have tasks to record a run.")
+
+    normalized_results, total_duration, completed_duration = build_run_tasks(
+        circuit_tasks, payload.get("tasks")
+    )
+
+    started_at = parse_iso_datetime(payload.get("started_at"), "started_at")
+    ended_at = parse_iso_datetime(payload.get("ended_at"), "ended_at")
+    if ended_at < started_at:
+        raise ValueError("ended_at cannot be before started_at.")
 
     run = CircuitRun(
         circuit_id=circuit.id,
@@ -451,47 +1088,115 @@ def record_circuit_run(
     session.add(run)
     session.flush()
 
-    task_models = [
-        CircuitRunTask(
-            run_id=run.id,
-            task_index=item["index"],
-            name=item["name"],
-            description=item["description"],
-            duration=item["duration"],
-            status=item["status"],
-        )
-        for item in normalized_results
-    ]
-    session.add_all(task_models)
-    session.commit()
-    session.refresh(run)
+    task_rows = _run_task_rows(run.id, normalized_results)
+    # One executemany for all task rows; the returned models are transient
+    # copies for serialization and never added to the session.
+    session.execute(insert(CircuitRunTask), task_rows)
+    task_models = [CircuitRunTask(**row) for row in task_rows]
+    record_change(session, "run", run.id)
     return run, task_models
 
 
-def get_circuit_or_404(circuit_id: int) -> Circuit:
+def load_circuit_ref(session: Session, circuit_id: int) -> CircuitRef | None:
+    row = session.exec(
+        select(Circuit.id, Circuit.revision, Circuit.name, Circuit.task_count).where(
+            Circuit.id == circuit_id
+        )
+    ).first()
+    return CircuitRef(*row) if row is not None else None
+
+
+def lookup_circuit(circuit_id: int) -> CircuitRef | None:
+    cache_coherence.validate()
+    ref = circuit_index.get(circuit_id)
+    if ref is not None:
+        return ref
+    generation = circuit_index.generation
     with get_session() as session:
-        circuit = session.get(Circuit, circuit_id)
-        if circuit is None:
-            raise HTTPException(status_code=404, detail="Circuit not found")
-        session.expunge(circuit)
-        return circuit
+        ref = load_circuit_ref(session, circuit_id)
+    if ref is None:
+        return None
+    circuit_index.set(circuit_id, ref, generation)
+    return ref
+
+
+def require_circuit(circuit_id: int) -> CircuitRef:
+    ref = lookup_circuit(circuit_id)
+    if ref is None:
+        raise HTTPException(status_code=404, detail="Circuit not found")
+    return ref
 
 
 @app.get("/api/circuits/{circuit_id}")
-def circuit_api(circuit_id: int):
+def circuit_api(circuit_id: int, include_tasks: bool = True):
+    cache_coherence.validate()
+    generation = circuit_fragments.generation
     with get_session() as session:
         circuit = session.get(Circuit, circuit_id)
         if circuit is None:
             raise HTTPException(status_code=404, detail="Circuit not found")
         active = get_circuit_session(session, circuit_id)
-        session.expunge(circuit)
-        if active is not None:
-            session.expunge(active)
-    return serialize_circuit_model(circuit, active)
+        if not include_tasks:
+            return serialize_circuit_model(circuit, active)
+        cached = circuit_fragments.get(circuit_id)
+        if cached is not None and cached[0] == circuit.revision:
+            fragment = cached[1]
+        else:
+            fragment = encode_circuit_fragment(
+                circuit, load_circuit_tasks(session, circuit_id)
+            )
+            circuit_fragments.set(circuit_id, (circuit.revision, fragment), generation)
+        content = render_circuit_fragment(fragment, active)
+    return json_bytes_response(content)
+
+
+@app.get("/api/circuits/{circuit_id}/tasks")
+def api_list_circuit_tasks(
+    circuit_id: int,
+    offset: int = 0,
+    limit: int = 100,
+    circuit: CircuitRef = Depends(require_circuit),
+):
+    if offset < 0:
+        raise HTTPException(status_code=422, detail="offset must be a non-negative integer.")
+    if limit <= 0 or limit > MAX_TASK_PAGE_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"limit must be between 1 and {MAX_TASK_PAGE_SIZE}.",
+        )
+    with get_session() as session:
+        tasks = load_circuit_tasks(session, circuit_id, offset, limit)
+    return {
+        "offset": offset,
+        "limit": limit,
+        "total": circuit.task_count,
+        "tasks": [
+            {"index": offset + position, **task} for position, task in enumerate(tasks)
+        ],
+    }
+
+
+@app.patch("/api/circuits/{circuit_id}/tasks")
+def api_splice_circuit_tasks(circuit_id: int, payload: Dict[str, Any]):
+    def write(session: Session) -> Dict[str, Any]:
+        circuit = session.get(Circuit, circuit_id)
+        if circuit is None:
+            raise HTTPException(status_code=404, detail="Circuit not found")
+        # Tasks are left out of the response; fetch the edited range from
+        # GET /api/circuits/{id}/tasks if needed.
+        circuit, session_model = splice_circuit_tasks(session, circuit, payload)
+        return serialize_circuit_model(circuit, session_model)
+
+    try:
+        return write_queue.run(write)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
 
 
 @app.get("/api/circuits")
 def circuits_api():
+    cache_coherence.validate()
+    generation = circuit_fragments.generation
     with get_session() as session:
         circuits = session.exec(select(Circuit).order_by(Circuit.created_at.desc())).all()
         circuit_ids = [c.id for c in circuits if c.id is not None]
@@ -503,68 +1208,128 @@ def circuits_api():
                 )
             ).all()
             sessions_map = {s.circuit_id: s for s in sessions}
-        data = [
-            serialize_circuit_model(circuit, sessions_map.get(circuit.id))
+        fragments: Dict[int, bytes] = {}
+        for circuit in circuits:
+            cached = circuit_fragments.peek(circuit.id)
+            if cached is not None and cached[0] == circuit.revision:
+                fragments[circuit.id] = cached[1]
+        missing = [circuit_id for circuit_id in circuit_ids if circuit_id not in fragments]
+        tasks_map = load_tasks_for_circuits(session, missing)
+        for circuit in circuits:
+            if circuit.id in fragments:
+                continue
+            fragment = encode_circuit_fragment(circuit, tasks_map.get(circuit.id, []))
+            circuit_fragments.add(circuit.id, (circuit.revision, fragment), generation)
+            fragments[circuit.id] = fragment
+        content = b"[" + b",".join(
+            render_circuit_fragment(fragments[circuit.id], sessions_map.get(circuit.id))
             for circuit in circuits
-        ]
-    return data
+        ) + b"]"
+    return json_bytes_response(content)
 
 
 @app.post("/api/circuits", status_code=status.HTTP_201_CREATED)
 def api_create_circuit(payload: Dict[str, Any]):
-    with get_session() as session:
-        try:
-            circuit = create_or_update_circuit(session, None, payload)
-        except ValueError as exc:
-            raise HTTPException(status_code=422, detail=str(exc)) from exc
-    return serialize_circuit_model(circuit)
+    def write(session: Session) -> Dict[str, Any]:
+        circuit = create_or_update_circuit(session, None, payload)
+        return serialize_circuit_model(circuit, tasks=load_circuit_tasks(session, circuit.id))
+
+    try:
+        return write_queue.run(write)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
 
 
 @app.put("/api/circuits/{circuit_id}")
 def api_update_circuit(circuit_id: int, payload: Dict[str, Any]):
-    with get_session() as session:
+    def write(session: Session) -> Dict[str, Any]:
         circuit = session.get(Circuit, circuit_id)
         if circuit is None:
             raise HTTPException(status_code=404, detail="Circuit not found")
-        try:
-            circuit = create_or_update_circuit(session, circuit, payload)
-        except ValueError as exc:
-            raise HTTPException(status_code=422, detail=str(exc)) from exc
-    return serialize_circuit_model(circuit)
+        circuit = create_or_update_circuit(session, circuit, payload)
+        return serialize_circuit_model(circuit, tasks=load_circuit_tasks(session, circuit.id))
+
+    try:
+        return write_queue.run(write)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
 
 
 @app.delete("/api/circuits/{circuit_id}", status_code=status.HTTP_204_NO_CONTENT)
 def api_delete_circuit(circuit_id: int):
-    with get_session() as session:
+    def write(session: Session) -> None:
         circuit = session.get(Circuit, circuit_id)
         if circuit is None:
             raise HTTPException(status_code=404, detail="Circuit not found")
+        session.execute(delete(CircuitTask).where(CircuitTask.circuit_id == circuit_id))
+        removed = session.execute(
+            delete(CircuitRunSession).where(CircuitRunSession.circuit_id == circuit_id)
+        )
         session.delete(circuit)
-        session.commit()
+        record_change(session, "circuit", circuit_id, "delete")
+        if removed.rowcount:
+            record_change(session, "session", circuit_id, "delete")
+
+    write_queue.run(write)
+    circuit_fragments.pop(circuit_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@app.post("/api/circuits/{circuit_id}/runs", status_code=status.HTTP_201_CREATED)
-def api_create_run(circuit_id: int, payload: Dict[str, Any]):
-    with get_session() as session:
-        circuit = session.get(Circuit, circuit_id)
+RunWriter = Callable[
+    [Session, CircuitRef, Dict[str, Any]], tuple[CircuitRun, List[CircuitRunTask]]
+]
+
+
+def create_run_idempotently(
+    circuit_id: int,
+    payload: Dict[str, Any],
+    idempotency_key: str | None,
+    action: str,
+    create: RunWriter,
+) -> Response:
+    """Record a run with ``create`` and answer 201, replaying repeated keys.
+
+    The key is reserved and completed in the same transaction as the run, so
+    a failed request leaves nothing behind to release. The circuit is
+    resolved after the replay check so a retry still gets its stored response
+    once the circuit has been deleted.
+    """
+
+    def write(session: Session) -> Response:
+        replay = replay_or_reserve(
+            session, idempotency_key, f"POST /api/circuits/{circuit_id}/{action}"
+        )
+        if replay is not None:
+            return replay
+        circuit = load_circuit_ref(session, circuit_id)
         if circuit is None:
             raise HTTPException(status_code=404, detail="Circuit not found")
-        try:
-            run, tasks = record_circuit_run(session, circuit, payload)
-        except ValueError as exc:
-            session.rollback()
-            raise HTTPException(status_code=422, detail=str(exc)) from exc
-        data = serialize_run_model(run, tasks, circuit)
-    return data
+        run, tasks = create(session, circuit, payload)
+        content = encode_json(serialize_run_model(run, tasks, circuit))
+        if idempotency_key is not None:
+            idempotency.complete(session, idempotency_key, status.HTTP_201_CREATED, content)
+        return json_bytes_response(content, status.HTTP_201_CREATED)
+
+    try:
+        return write_queue.run(write)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+@app.post("/api/circuits/{circuit_id}/runs", status_code=status.HTTP_201_CREATED)
+def api_create_run(
+    circuit_id: int,
+    payload: Dict[str, Any],
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
+    return create_run_idempotently(
+        circuit_id, payload, idempotency_key, "runs", record_circuit_run
+    )
 
 
 @app.get("/api/circuits/{circuit_id}/session")
-def api_get_run_session(circuit_id: int):
+def api_get_run_session(circuit_id: int, circuit: CircuitRef = Depends(require_circuit)):
     with get_session() as session:
-        circuit = session.get(Circuit, circuit_id)
-        if circuit is None:
-            raise HTTPException(status_code=404, detail="Circuit not found")
         session_model = get_circuit_session(session, circuit_id)
         if session_model is None:
             raise HTTPException(status_code=404, detail="Circuit run session not found")
@@ -573,54 +1338,93 @@ def api_get_run_session(circuit_id: int):
 
 
 @app.put("/api/circuits/{circuit_id}/session")
-def api_upsert_run_session(circuit_id: int, payload: Dict[str, Any]):
-    with get_session() as session:
-        circuit = session.get(Circuit, circuit_id)
-        if circuit is None:
+def api_upsert_run_session(
+    circuit_id: int, payload: Dict[str, Any], circuit: CircuitRef = Depends(require_circuit)
+):
+    def write(session: Session) -> Dict[str, Any]:
+        # ``circuit`` was read before the write lock was taken; the statuses
+        # are validated against its task count, so it must still be current.
+        revision = session.exec(
+            select(Circuit.revision).where(Circuit.id == circuit.id)
+        ).first()
+        if revision is None:
             raise HTTPException(status_code=404, detail="Circuit not found")
-        try:
-            session_model = upsert_circuit_session(session, circuit, payload)
-        except ValueError as exc:
-            session.rollback()
-            raise HTTPException(status_code=422, detail=str(exc)) from exc
-    return serialize_session_model(session_model)
+        if revision != circuit.revision:
+            raise HTTPException(
+                status_code=409, detail="Circuit was edited while saving; reload it."
+            )
+        return serialize_session_model(upsert_circuit_session(session, circuit, payload))
+
+    try:
+        return write_queue.run(write)
+    except SessionVersionConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+@app.patch("/api/circuits/{circuit_id}/session")
+def api_patch_run_session(
+    circuit_id: int, payload: Dict[str, Any], circuit: CircuitRef = Depends(require_circuit)
+):
+    def write(session: Session) -> Dict[str, Any] | None:
+        session_model = patch_circuit_session(session, circuit_id, payload)
+        return serialize_session_model(session_model) if session_model else None
+
+    try:
+        data = write_queue.run(write)
+    except SessionVersionConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    if data is None:
+        raise HTTPException(status_code=404, detail="Circuit run session not found")
+    return data
 
 
 @app.delete("/api/circuits/{circuit_id}/session", status_code=status.HTTP_204_NO_CONTENT)
-def api_delete_run_session(circuit_id: int):
-    with get_session() as session:
-        circuit = session.get(Circuit, circuit_id)
-        if circuit is None:
-            raise HTTPException(status_code=404, detail="Circuit not found")
-        removed = remove_circuit_session(session, circuit_id)
+def api_delete_run_session(circuit_id: int, circuit: CircuitRef = Depends(require_circuit)):
+    removed = write_queue.run(lambda session: remove_circuit_session(session, circuit_id))
     if not removed:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @app.post("/api/circuits/{circuit_id}/session/finish", status_code=status.HTTP_201_CREATED)
-def api_finish_run_session(circuit_id: int, payload: Dict[str, Any]):
-    with get_session() as session:
-        circuit = session.get(Circuit, circuit_id)
-        if circuit is None:
-            raise HTTPException(status_code=404, detail="Circuit not found")
-        try:
-            run, tasks = finalize_circuit_session(session, circuit, payload)
-        except ValueError as exc:
-            session.rollback()
-            raise HTTPException(status_code=422, detail=str(exc)) from exc
-        data = serialize_run_model(run, tasks, circuit)
-    return data
+def api_finish_run_session(
+    circuit_id: int,
+    payload: Dict[str, Any],
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
+    return create_run_idempotently(
+        circuit_id, payload, idempotency_key, "session/finish", finalize_circuit_session
+    )
 
 
 @app.get("/api/runs")
 def api_list_runs():
+    cache_coherence.validate()
+    generation = run_fragments.generation
     with get_session() as session:
         runs = session.exec(select(CircuitRun).order_by(CircuitRun.started_at.desc())).all()
         if not runs:
             return []
 
-        run_ids = [run.id for run in runs if run.id is not None]
+        circuit_ids = {run.circuit_id for run in runs}
+        circuits = session.exec(select(Circuit).where(Circuit.id.in_(circuit_ids))).all()
+        circuit_map = {c.id: c for c in circuits}
+
+        # A run's JSON only changes when its circuit is renamed, so fragments
+        # are validated against the circuit revision they were built with.
+        fragments: Dict[int, bytes] = {}
+        for run in runs:
+            circuit = circuit_map.get(run.circuit_id)
+            revision = circuit.revision if circuit else 0
+            cached = run_fragments.peek(run.id)
+            if cached is not None and cached[0] == revision:
+                fragments[run.id] = cached[1]
+
+        run_ids = [run.id for run in runs if run.id not in fragments]
         tasks_map: Dict[int, List[CircuitRunTask]] = {}
         if run_ids:
             tasks = session.exec(
@@ -629,24 +1433,25 @@ def api_list_runs():
             for task in tasks:
                 tasks_map.setdefault(task.run_id, []).append(task)
 
-        circuit_ids = {run.circuit_id for run in runs}
-        circuits = session.exec(select(Circuit).where(Circuit.id.in_(circuit_ids))).all()
-        circuit_map = {c.id: c for c in circuits}
-
-        data = [
-            serialize_run_model(
-                run,
-                tasks_map.get(run.id or -1, []),
-                circuit_map.get(run.circuit_id),
+        for run in runs:
+            if run.id in fragments:
+                continue
+            circuit = circuit_map.get(run.circuit_id)
+            fragment = encode_json(
+                serialize_run_model(run, tasks_map.get(run.id or -1, []), circuit)
             )
-            for run in runs
-        ]
-    return data
+            run_fragments.add(
+                run.id, (circuit.revision if circuit else 0, fragment), generation
+            )
+            fragments[run.id] = fragment
+
+        content = b"[" + b",".join(fragments[run.id] for run in runs) + b"]"
+    return json_bytes_response(content)
 
 
 @app.delete("/api/runs/{run_id}", status_code=status.HTTP_204_NO_CONTENT)
 def api_delete_run(run_id: int):
-    with get_session() as session:
+    def write(session: Session) -> None:
         run = session.get(CircuitRun, run_id)
         if run is None:
             raise HTTPException(status_code=404, detail="Run not found")
@@ -658,11 +1463,162 @@ def api_delete_run(run_id: int):
             session.delete(task)
 
         session.delete(run)
-        session.commit()
+        record_change(session, "run", run_id, "delete")
+
+    write_queue.run(write)
+    run_fragments.pop(run_id)
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+def load_sync_payloads(
+    session: Session, entries: List[ChangeLogEntry]
+) -> Dict[tuple[str, int], Dict[str, Any]]:
+    """Current payload of every upserted entity in ``entries``, one query per kind."""
+
+    wanted: Dict[str, List[int]] = {"circuit": [], "run": [], "session": []}
+    for entry in entries:
+        if entry.op == "upsert":
+            wanted[entry.entity].append(entry.entity_id)
+
+    payloads: Dict[tuple[str, int], Dict[str, Any]] = {}
+    if wanted["circuit"]:
+        circuits = session.exec(select(Circuit).where(Circuit.id.in_(wanted["circuit"]))).all()
+        tasks_map = load_tasks_for_circuits(session, [circuit.id for circuit in circuits])
+        for circuit in circuits:
+            data = serialize_circuit_model(circuit, tasks=tasks_map[circuit.id])
+            del data["active_run"]
+            payloads[("circuit", circuit.id)] = data
+
+    if wanted["session"]:
+        session_models = session.exec(
+            select(CircuitRunSession).where(CircuitRunSession.circuit_id.in_(wanted["session"]))
+        ).all()
+        for session_model in session_models:
+            data = serialize_session_model(session_model)
+            data["circuit_id"] = session_model.circuit_id
+            payloads[("session", session_model.circuit_id)] = data
+
+    if wanted["run"]:
+        runs = session.exec(select(CircuitRun).where(CircuitRun.id.in_(wanted["run"]))).all()
+        tasks_by_run: Dict[int, List[CircuitRunTask]] = {}
+        if runs:
+            run_tasks = session.exec(
+                select(CircuitRunTask).where(
+                    CircuitRunTask.run_id.in_([run.id for run in runs])
+                )
+            ).all()
+            for task in run_tasks:
+                tasks_by_run.setdefault(task.run_id, []).append(task)
+            circuit_ids = {run.circuit_id for run in runs}
+            circuit_names = {
+                circuit_id: CircuitRef(circuit_id, 0, name, 0)
+                for circuit_id, name in session.exec(
+                    select(Circuit.id, Circuit.name).where(Circuit.id.in_(circuit_ids))
+                )
+            }
+            for run in runs:
+                payloads[("run", run.id)] = serialize_run_model(
+                    run, tasks_by_run.get(run.id, []), circuit_names.get(run.circuit_id)
+                )
+    return payloads
+
+
+@app.get("/api/sync")
+def api_sync(since: int = 0, limit: int = SYNC_PAGE_SIZE):
+    if since < 0:
+        raise HTTPException(status_code=422, detail="since must be zero or greater")
+    if limit < 1 or limit > MAX_SYNC_PAGE_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"limit must be between 1 and {MAX_SYNC_PAGE_SIZE}",
+        )
+    with get_session() as session:
+        entries = changelog.changes_since(session, since, limit + 1)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        payloads = load_sync_payloads(session, entries)
+
+    changes: List[Dict[str, Any]] = []
+    for entry in entries:
+        if entry.op == "delete":
+            changes.append(
+                {"seq": entry.seq, "entity": entry.entity, "id": entry.entity_id, "op": "delete"}
+            )
+            continue
+        data = payloads.get((entry.entity, entry.entity_id))
+        if data is None:
+            # Deleted after the log was read; its tombstone has a later seq
+            # and arrives on the next page.
+            continue
+        changes.append(
+            {
+                "seq": entry.seq,
+                "entity": entry.entity,
+                "id": entry.entity_id,
+                "op": "upsert",
+                "data": data,
+            }
+        )
+
+    cursor = entries[-1].seq if entries else since
+    return json_bytes_response(
+        encode_json({"changes": changes, "cursor": cursor, "has_more": has_more})
+    )
+
+
+def require_admin(authorization: str | None = Header(default=None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail="Admin endpoints are disabled; set CIRCUITS_ADMIN_TOKEN to enable them.",
+        )
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.encode(), ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid admin token.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.post("/api/admin/sessions/sweep", dependencies=[Depends(require_admin)])
+def api_sweep_sessions(policy: str | None = None, stale_after_seconds: int | None = None):
+    if policy is None:
+        # "off" only disables the background sweep; an explicit request
+        # still sweeps with the configured policy, or finalize.
+        policy = SESSION_SWEEP_POLICY if SESSION_SWEEP_POLICY != "off" else "finalize"
+    try:
+        return sweep_stale_sessions(
+            policy,
+            SESSION_STALE_AFTER_SECONDS if stale_after_seconds is None else stale_after_seconds,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+@app.post("/api/admin/backup", dependencies=[Depends(require_admin)])
+def api_create_backup(compress: bool = backup.BACKUP_COMPRESS):
+    # On-demand snapshots are streamed and then deleted, so they never enter
+    # (or prune) the scheduled snapshots kept under BACKUP_DIR.
+    backup.BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    workdir = Path(tempfile.mkdtemp(prefix=".download-", dir=backup.BACKUP_DIR))
+    try:
+        snapshot = backup.create_snapshot(engine, directory=workdir, compress=compress)
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    media_type = "application/gzip" if compress else "application/vnd.sqlite3"
+    return FileResponse(
+        snapshot,
+        media_type=media_type,
+        filename=snapshot.name,
+        background=BackgroundTask(shutil.rmtree, workdir, ignore_errors=True),
+    )
+
+
 @app.get("/api/circuit-schema")
 def circuit_schema():
     schema = {
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime
 from typing import Callable, Iterable, Tuple
 
@@ -8,7 +9,7 @@ from sqlalchemy.engine import Connection
 
 from sqlmodel import SQLModel
 
-from ..models import CircuitRunSession
+from ..models import ChangeLogEntry, CircuitRunSession, CircuitTask, IdempotencyRecord
 
 Migration = Tuple[str, Callable[[Connection], None]]
 
@@ -40,17 +41,157 @@ def _record_migration(conn: Connection, version: str) -> None:
     )
 
 
+def _table_exists(conn: Connection, table: str) -> bool:
+    result = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": table},
+    )
+    return result.first() is not None
+
+
+def _column_exists(conn: Connection, table: str, column: str) -> bool:
+    result = conn.execute(text(f"PRAGMA table_info({table})"))
+    return any(row[1] == column for row in result)
+
+
 def _migration_2024051401(conn: Connection) -> None:
     CircuitRunSession.__table__.create(bind=conn, checkfirst=True)
 
 
+def _migration_2024060101(conn: Connection) -> None:
+    conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS cache_generation (
+                scope TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+    )
+
+
+def _migration_2024060201(conn: Connection) -> None:
+    if not _column_exists(conn, "circuitrunsession", "version"):
+        conn.execute(
+            text(
+                "ALTER TABLE circuitrunsession ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+            )
+        )
+
+
+def _migration_2024060301(conn: Connection) -> None:
+    CircuitTask.__table__.create(bind=conn, checkfirst=True)
+    if not _table_exists(conn, "circuit"):
+        return
+    if not _column_exists(conn, "circuit", "task_count"):
+        conn.execute(
+            text("ALTER TABLE circuit ADD COLUMN task_count INTEGER NOT NULL DEFAULT 0")
+        )
+    circuits = conn.execute(text("SELECT id, tasks_json FROM circuit")).all()
+    for circuit_id, tasks_json in circuits:
+        try:
+            tasks = json.loads(tasks_json or "[]")
+        except json.JSONDecodeError:
+            tasks = []
+        if not isinstance(tasks, list):
+            tasks = []
+        rows = [
+            {
+                "circuit_id": circuit_id,
+                "position": position,
+                "name": task.get("name", ""),
+                "description": task.get("description", ""),
+                "duration": task.get("duration", 0),
+            }
+            for position, task in enumerate(tasks)
+            if isinstance(task, dict)
+        ]
+        if rows:
+            conn.execute(CircuitTask.__table__.insert(), rows)
+        conn.execute(
+            text("UPDATE circuit SET task_count = :count, tasks_json = '[]' WHERE id = :id"),
+            {"count": len(rows), "id": circuit_id},
+        )
+
+
+def _migration_2024060401(conn: Connection) -> None:
+    if _table_exists(conn, "circuit") and not _column_exists(conn, "circuit", "revision"):
+        conn.execute(
+            text("ALTER TABLE circuit ADD COLUMN revision INTEGER NOT NULL DEFAULT 1")
+        )
+
+
+def _migration_2024060501(conn: Connection) -> None:
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_circuitrunsession_updated_at "
+            "ON circuitrunsession (updated_at)"
+        )
+    )
+
+
+def _migration_2024060601(conn: Connection) -> None:
+    IdempotencyRecord.__table__.create(bind=conn, checkfirst=True)
+
+
+def _migration_2024060701(conn: Connection) -> None:
+    ChangeLogEntry.__table__.create(bind=conn, checkfirst=True)
+    # Seed the log with every existing row so a client syncing from zero
+    # receives the whole dataset.
+    now = datetime.utcnow().isoformat(sep=" ")
+    for entity, table, column in (
+        ("circuit", "circuit", "id"),
+        ("run", "circuitrun", "id"),
+        ("session", "circuitrunsession", "circuit_id"),
+    ):
+        if not _table_exists(conn, table):
+            continue
+        conn.execute(
+            text(
+                "INSERT OR IGNORE INTO changelog (entity, entity_id, op, changed_at) "
+                f"SELECT :entity, {column}, 'upsert', :now FROM {table} ORDER BY id"
+            ),
+            {"entity": entity, "now": now},
+        )
+
+
+
+def _migration_2024060801(conn: Connection) -> None:
+    # Deleting a circuit used to leave its session behind; paused ones were
+    # never swept. Drop them and log tombstones so synced clients do too.
+    if not _table_exists(conn, "circuit"):
+        return
+    orphaned = "SELECT circuit_id FROM circuitrunsession WHERE circuit_id NOT IN (SELECT id FROM circuit)"
+    conn.execute(
+        text(
+            "INSERT OR REPLACE INTO changelog (entity, entity_id, op, changed_at) "
+            f"SELECT 'session', circuit_id, 'delete', :now FROM ({orphaned})"
+        ),
+        {"now": datetime.utcnow().isoformat(sep=" ")},
+    )
+    conn.execute(text(f"DELETE FROM circuitrunsession WHERE circuit_id IN ({orphaned})"))
+
+
 MIGRATIONS: Iterable[Migration] = [
     ("2024051401_add_circuit_run_sessions", _migration_2024051401),
+    ("2024060101_add_cache_generation", _migration_2024060101),
+    ("2024060201_add_session_version", _migration_2024060201),
+    ("2024060301_move_circuit_tasks_to_table", _migration_2024060301),
+    ("2024060401_add_circuit_revision", _migration_2024060401),
+    ("2024060501_index_session_updated_at", _migration_2024060501),
+    ("2024060601_add_idempotency_records", _migration_2024060601),
+    ("2024060701_add_changelog", _migration_2024060701),
+    ("2024060801_drop_orphaned_sessions", _migration_2024060801),
 ]
 
 
 def run_migrations(engine) -> None:
-    with engine.begin() as conn:
+    with engine.connect() as conn:
+        # Workers start together; take the write lock before reading the
+        # history so only the first one applies each migration and the others
+        # wait for it, then find nothing left to do.
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
         _ensure_history_table(conn)
         applied = _already_applied(conn)
         for version, migration in MIGRATIONS:
@@ -58,5 +199,6 @@ def run_migrations(engine) -> None:
                 continue
             migration(conn)
             _record_migration(conn, version)
-    # Ensure metadata is updated for fresh databases
-    SQLModel.metadata.create_all(engine)
+        # Ensure metadata is updated for fresh databases
+        SQLModel.metadata.create_all(conn)
+        conn.commit()
@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any, Dict
 
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import Field, SQLModel
 
 
@@ -10,19 +11,25 @@ class Circuit(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     name: str
     description: str
-    tasks_json: str
+    # Superseded by CircuitTask rows; kept so existing databases stay readable.
+    tasks_json: str = Field(default="[]", nullable=False)
+    task_count: int = Field(default=0, nullable=False)
+    revision: int = Field(default=1, nullable=False)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
-    def tasks(self) -> list[Dict[str, Any]]:
-        from json import loads
 
-        try:
-            data = loads(self.tasks_json)
-            if isinstance(data, list):
-                return data
-        except Exception:
-            pass
-        return []
+class CircuitTask(SQLModel, table=True):
+    __table_args__ = (Index("ix_circuittask_circuit_id_position", "circuit_id", "position"),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    circuit_id: int = Field(foreign_key="circuit.id", nullable=False)
+    position: int = Field(nullable=False)
+    name: str
+    description: str
+    duration: int = Field(nullable=False)
+
+    def as_payload(self) -> Dict[str, Any]:
+        return {"name": self.name, "description": self.description, "duration": self.duration}
 
 
 class CircuitRun(SQLModel, table=True):
@@ -56,5 +63,30 @@ class CircuitRunSession(SQLModel, table=True):
     last_started_at: datetime | None = Field(default=None, nullable=True)
     elapsed_seconds: int = Field(default=0, nullable=False)
     task_statuses_json: str = Field(default="[]", nullable=False)
+    version: int = Field(default=1, nullable=False)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
-    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    endpoint: str = Field(nullable=False)
+    status_code: int | None = Field(default=None, nullable=True)
+    response_body: bytes | None = Field(default=None, nullable=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+
+
+class ChangeLogEntry(SQLModel, table=True):
+    """Latest change per entity; ``seq`` is never reused, so clients can page by it."""
+
+    __tablename__ = "changelog"
+    __table_args__ = (
+        UniqueConstraint("entity", "entity_id", name="uq_changelog_entity"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq: int | None = Field(default=None, primary_key=True)
+    entity: str = Field(nullable=False)
+    entity_id: int = Field(nullable=False)
+    op: str = Field(nullable=False)
+    changed_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
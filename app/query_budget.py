@@ -0,0 +1,462 @@
+"""Per-route SQL query budgets and an N+1 check for the API.
+
+Every route in ``app.main`` declares the most queries one request may issue
+in ``ROUTE_BUDGETS``. Set ``CIRCUITS_QUERY_BUDGET`` to ``warn`` or
+``enforce`` to have each request checked against its budget while the app
+runs, or run ``python -m app.query_budget`` to exercise every route against
+datasets of 10 and 1,000 rows. The check fails when a route is missing a
+budget, goes over it, or issues more queries on the larger dataset.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_MODE = os.environ.get("CIRCUITS_QUERY_BUDGET", "off")
+QUERY_BUDGET_MODES = {"off", "warn", "enforce"}
+
+RouteKey = Tuple[str, str]
+
+# Maximum SQL statements per request, keyed by method and route path. The
+# cross-worker cache check runs on its own sqlite3 connection and is not
+# counted; caches are cold when budgets are measured.
+ROUTE_BUDGETS: Dict[RouteKey, int] = {
+    ("GET", "/api/circuits/{circuit_id}"): 3,
+    ("GET", "/api/circuits/{circuit_id}/tasks"): 2,
+    ("PATCH", "/api/circuits/{circuit_id}/tasks"): 11,
+    ("GET", "/api/circuits"): 3,
+    ("POST", "/api/circuits"): 5,
+    ("PUT", "/api/circuits/{circuit_id}"): 7,
+    ("DELETE", "/api/circuits/{circuit_id}"): 8,
+    ("POST", "/api/circuits/{circuit_id}/runs"): 11,
+    ("GET", "/api/circuits/{circuit_id}/session"): 2,
+    ("PUT", "/api/circuits/{circuit_id}/session"): 6,
+    ("PATCH", "/api/circuits/{circuit_id}/session"): 6,
+    ("DELETE", "/api/circuits/{circuit_id}/session"): 5,
+    ("POST", "/api/circuits/{circuit_id}/session/finish"): 15,
+    ("GET", "/api/runs"): 3,
+    ("DELETE", "/api/runs/{run_id}"): 6,
+    ("GET", "/api/sync"): 7,
+    # Per batch of SESSION_SWEEP_BATCH_SIZE stale sessions, see BATCHED_ROUTES.
+    ("POST", "/api/admin/sessions/sweep"): 11,
+    ("POST", "/api/admin/backup"): 0,
+    ("GET", "/api/circuit-schema"): 0,
+    ("GET", "/api/health"): 0,
+    ("GET", "/"): 0,
+    ("GET", "/{full_path:path}"): 0,
+}
+
+# Routes that work through rows in batches; their budget applies per batch of
+# this many rows, so they are only checked by ``python -m app.query_budget``.
+# The sweep size matches SESSION_SWEEP_BATCH_SIZE in ``app.main``.
+BATCHED_ROUTES: Dict[RouteKey, int] = {
+    ("POST", "/api/admin/sessions/sweep"): 100,
+}
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+        self.statements: List[str] = []
+
+
+_active_counter: ContextVar[QueryCounter | None] = ContextVar(
+    "circuits_query_counter", default=None
+)
+_listening: set[int] = set()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    counter = _active_counter.get()
+    if counter is not None:
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+def listen(engine: Engine) -> None:
+    if id(engine) in _listening:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    _listening.add(id(engine))
+
+
+@contextmanager
+def count_queries(engine: Engine) -> Iterator[QueryCounter]:
+    """Count statements ``engine`` executes in this context, including
+    threadpool work started from it."""
+
+    listen(engine)
+    counter = QueryCounter()
+    token = _active_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _active_counter.reset(token)
+
+
+def route_key(app, scope: Dict[str, Any]) -> RouteKey | None:
+    from starlette.routing import Match
+
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return scope["method"], route.path
+    return None
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware that checks each request against ``ROUTE_BUDGETS``."""
+
+    def __init__(self, app, engine: Engine, mode: str = QUERY_BUDGET_MODE) -> None:
+        self.app = app
+        self.engine = engine
+        self.mode = mode
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or self.mode == "off":
+            await self.app(scope, receive, send)
+            return
+        if self.mode == "warn":
+            with count_queries(self.engine) as counter:
+                await self.app(scope, receive, send)
+            message = self._check(scope, counter)
+            if message is not None:
+                logger.warning(message)
+            return
+
+        # ``enforce`` holds the response back until the count is known so an
+        # over-budget request can be answered with a 500 instead.
+        messages: List[Dict[str, Any]] = []
+
+        async def buffer(message: Dict[str, Any]) -> None:
+            messages.append(message)
+
+        with count_queries(self.engine) as counter:
+            await self.app(scope, receive, buffer)
+        message = self._check(scope, counter)
+        if message is not None:
+            logger.error(message)
+            from starlette.responses import JSONResponse
+
+            await JSONResponse({"detail": message}, status_code=500)(scope, receive, send)
+            return
+        for message in messages:
+            await send(message)
+
+    def _check(self, scope: Dict[str, Any], counter: QueryCounter) -> str | None:
+        key = route_key(scope["app"], scope)
+        if key is None:
+            return None
+        budget = ROUTE_BUDGETS.get(key)
+        if budget is None or key in BATCHED_ROUTES or counter.count <= budget:
+            return None
+        return f"{key[0]} {key[1]} issued {counter.count} queries (budget {budget})"
+
+
+def install(app, engine: Engine, mode: str = QUERY_BUDGET_MODE) -> None:
+    if mode not in QUERY_BUDGET_MODES:
+        raise ValueError("CIRCUITS_QUERY_BUDGET must be one of off, warn, or enforce.")
+    if mode == "off":
+        return
+    listen(engine)
+    app.add_middleware(QueryBudgetMiddleware, engine=engine, mode=mode)
+
+
+# --- N+1 check ---------------------------------------------------------------
+
+DATASET_SIZES = (10, 1000)
+TASKS_PER_CIRCUIT = 3
+
+# Each scenario receives the test client and the dataset size. Circuit 1 and
+# run 1 have ``size`` tasks and every other circuit has TASKS_PER_CIRCUIT, so
+# both per-circuit and per-task N+1 patterns show up as growth.
+Scenario = Callable[[Any, int], Any]
+
+
+def _task_payload(count: int) -> List[Dict[str, Any]]:
+    return [
+        {"name": f"Task {index}", "description": "", "duration": 30}
+        for index in range(count)
+    ]
+
+
+# ``python -m app.query_budget`` configures this token for the admin routes.
+HARNESS_ADMIN_TOKEN = "query-budget"
+ADMIN_HEADERS = {"Authorization": f"Bearer {HARNESS_ADMIN_TOKEN}"}
+
+
+SCENARIOS: Dict[RouteKey, Scenario] = {
+    ("GET", "/api/circuits/{circuit_id}"): lambda client, size: client.get("/api/circuits/1"),
+    ("GET", "/api/circuits/{circuit_id}/tasks"): lambda client, size: client.get(
+        "/api/circuits/1/tasks?offset=1&limit=2"
+    ),
+    ("PATCH", "/api/circuits/{circuit_id}/tasks"): lambda client, size: client.patch(
+        "/api/circuits/1/tasks",
+        json={"offset": 1, "delete_count": 1, "tasks": _task_payload(2)},
+    ),
+    ("GET", "/api/circuits"): lambda client, size: client.get("/api/circuits"),
+    ("POST", "/api/circuits"): lambda client, size: client.post(
+        "/api/circuits", json={"name": "New", "tasks": _task_payload(size)}
+    ),
+    ("PUT", "/api/circuits/{circuit_id}"): lambda client, size: client.put(
+        "/api/circuits/1", json={"name": "Renamed", "tasks": _task_payload(size)}
+    ),
+    ("DELETE", "/api/circuits/{circuit_id}"): lambda client, size: client.delete(
+        "/api/circuits/1"
+    ),
+    ("POST", "/api/circuits/{circuit_id}/runs"): lambda client, size: client.post(
+        "/api/circuits/1/runs",
+        json={"tasks": [{"index": index, "status": "completed"} for index in range(size)]},
+        headers={"Idempotency-Key": "query-budget"},
+    ),
+    ("GET", "/api/circuits/{circuit_id}/session"): lambda client, size: client.get(
+        "/api/circuits/1/session"
+    ),
+    ("PUT", "/api/circuits/{circuit_id}/session"): lambda client, size: client.put(
+        "/api/circuits/1/session", json={"task_statuses": ["pending"] * size}
+    ),
+    ("PATCH", "/api/circuits/{circuit_id}/session"): lambda client, size: client.patch(
+        "/api/circuits/1/session",
+        json={"version": 1, "task_statuses": {"0": "completed"}, "current_index": 1},
+    ),
+    ("DELETE", "/api/circuits/{circuit_id}/session"): lambda client, size: client.delete(
+        "/api/circuits/1/session"
+    ),
+    ("POST", "/api/circuits/{circuit_id}/session/finish"): lambda client, size: client.post(
+        "/api/circuits/1/session/finish",
+        json={},
+        headers={"Idempotency-Key": "query-budget"},
+    ),
+    ("GET", "/api/runs"): lambda client, size: client.get("/api/runs"),
+    ("DELETE", "/api/runs/{run_id}"): lambda client, size: client.delete("/api/runs/1"),
+    ("GET", "/api/sync"): lambda client, size: client.get("/api/sync?since=0"),
+    ("POST", "/api/admin/sessions/sweep"): lambda client, size: client.post(
+        "/api/admin/sessions/sweep?policy=finalize", headers=ADMIN_HEADERS
+    ),
+    ("POST", "/api/admin/backup"): lambda client, size: client.post(
+        "/api/admin/backup", headers=ADMIN_HEADERS
+    ),
+    ("GET", "/api/circuit-schema"): lambda client, size: client.get("/api/circuit-schema"),
+    ("GET", "/api/health"): lambda client, size: client.get("/api/health"),
+    ("GET", "/"): lambda client, size: client.get("/"),
+    ("GET", "/{full_path:path}"): lambda client, size: client.get("/runs"),
+}
+
+
+HARNESS_DIR_PREFIX = "circuits-query-budget-"
+
+
+def _harness_database(engine: Engine) -> bool:
+    database = Path(engine.url.database or "")
+    return (
+        database.parent.name.startswith(HARNESS_DIR_PREFIX)
+        and database.parent.parent == Path(tempfile.gettempdir())
+    )
+
+
+def seed_dataset(engine: Engine, size: int, stale_sessions: bool = False) -> None:
+    """Replace all rows with ``size`` circuits, sessions and runs.
+
+    With ``stale_sessions`` every session is in progress and last updated a
+    month ago, so the sweeper picks all of them up. Refuses to touch any
+    database but the temporary one created by ``main``.
+    """
+
+    if not _harness_database(engine):
+        raise RuntimeError(
+            f"Refusing to seed {engine.url.database}: not a query budget harness database."
+        )
+
+    from sqlmodel import SQLModel
+
+    from .models import (
+        ChangeLogEntry,
+        Circuit,
+        CircuitRun,
+        CircuitRunSession,
+        CircuitRunTask,
+        CircuitTask,
+    )
+
+    now = datetime.utcnow()
+    session_updated_at = now - timedelta(days=30) if stale_sessions else now
+    task_counts = {index: size if index == 1 else TASKS_PER_CIRCUIT for index in range(1, size + 1)}
+    with engine.begin() as conn:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            conn.execute(table.delete())
+        conn.execute(
+            Circuit.__table__.insert(),
+            [
+                {
+                    "id": index,
+                    "name": f"Circuit {index}",
+                    "description": "",
+                    "tasks_json": "[]",
+                    "task_count": count,
+                    "revision": 1,
+                    "created_at": now,
+                }
+                for index, count in task_counts.items()
+            ],
+        )
+        conn.execute(
+            CircuitTask.__table__.insert(),
+            [
+                {"circuit_id": index, "position": position, **task}
+                for index, count in task_counts.items()
+                for position, task in enumerate(_task_payload(count))
+            ],
+        )
+        conn.execute(
+            CircuitRunSession.__table__.insert(),
+            [
+                {
+                    "circuit_id": index,
+                    "status": "in_progress" if stale_sessions else "paused",
+                    "current_task_index": 0,
+                    "remaining_seconds": 30,
+                    "has_started": True,
+                    "running": False,
+                    "elapsed_seconds": 0,
+                    "task_statuses_json": json.dumps(["pending"] * count),
+                    "version": 1,
+                    "created_at": session_updated_at,
+                    "updated_at": session_updated_at,
+                }
+                for index, count in task_counts.items()
+            ],
+        )
+        conn.execute(
+            CircuitRun.__table__.insert(),
+            [
+                {
+                    "id": index,
+                    "circuit_id": index,
+                    "started_at": now,
+                    "ended_at": now,
+                    "total_duration_seconds": 30 * count,
+                    "completed_duration_seconds": 30,
+                }
+                for index, count in task_counts.items()
+            ],
+        )
+        conn.execute(
+            CircuitRunTask.__table__.insert(),
+            [
+                {
+                    "run_id": index,
+                    "task_index": position,
+                    "name": task["name"],
+                    "description": "",
+                    "duration": task["duration"],
+                    "status": "completed" if position == 0 else "not_done",
+                }
+                for index, count in task_counts.items()
+                for position, task in enumerate(_task_payload(count))
+            ],
+        )
+        conn.execute(
+            ChangeLogEntry.__table__.insert(),
+            [
+                {"entity": entity, "entity_id": index, "op": "upsert", "changed_at": now}
+                for index in task_counts
+                for entity in ("circuit", "session", "run")
+            ],
+        )
+
+
+def measure(client, engine: Engine, size: int) -> Dict[RouteKey, Tuple[int, int]]:
+    from .database import cache_coherence
+
+    results: Dict[RouteKey, Tuple[int, int]] = {}
+    for key, scenario in SCENARIOS.items():
+        seed_dataset(engine, size, stale_sessions=key in BATCHED_ROUTES)
+        cache_coherence.invalidate_all()
+        with count_queries(engine) as counter:
+            response = scenario(client, size)
+        results[key] = (counter.count, response.status_code)
+    return results
+
+
+def run_check() -> List[str]:
+    from fastapi.routing import APIRoute
+    from fastapi.testclient import TestClient
+
+    from .database import engine
+    from .main import app
+
+    failures: List[str] = []
+    routes = {
+        (method, route.path)
+        for route in app.router.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+    for key in sorted(routes - set(ROUTE_BUDGETS)):
+        failures.append(f"{key[0]} {key[1]} has no query budget")
+    for key in sorted(routes - set(SCENARIOS)):
+        failures.append(f"{key[0]} {key[1]} has no scenario")
+
+    with TestClient(app) as client:
+        measurements = {size: measure(client, engine, size) for size in DATASET_SIZES}
+
+    small, large = DATASET_SIZES
+    for key in SCENARIOS:
+        budget = ROUTE_BUDGETS.get(key, 0)
+        small_count, small_status = measurements[small][key]
+        large_count, large_status = measurements[large][key]
+        label = f"{key[0]} {key[1]}"
+        if key in BATCHED_ROUTES:
+            # Every row is seeded for the batched work; the final batch read
+            # that comes back short or empty counts as a batch of its own.
+            small_count = -(-small_count // (small // BATCHED_ROUTES[key] + 1))
+            large_count = -(-large_count // (large // BATCHED_ROUTES[key] + 1))
+            label += " (per batch)"
+        print(
+            f"{label:50} {small_count:3d} @ {small} rows  {large_count:3d} @ {large} rows"
+            f"  budget {budget:3d}  status {small_status}/{large_status}"
+        )
+        # 503 is the SPA routes answering without a frontend build.
+        if any(code >= 500 and code != 503 for code in (small_status, large_status)):
+            failures.append(f"{label} failed with status {small_status}/{large_status}")
+        if max(small_count, large_count) > budget:
+            failures.append(
+                f"{label} issued {max(small_count, large_count)} queries (budget {budget})"
+            )
+        if large_count > small_count:
+            failures.append(
+                f"{label} issued {small_count} queries for {small} rows but "
+                f"{large_count} for {large} rows (N+1)"
+            )
+    return failures
+
+
+def main() -> int:
+    failures = run_check()
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    # The check wipes and reseeds its database, so it never uses a configured one.
+    workdir = tempfile.mkdtemp(prefix=HARNESS_DIR_PREFIX)
+    os.environ["CIRCUITS_DATABASE_URL"] = f"sqlite:///{workdir}/circuits.db"
+    os.environ["CIRCUITS_BACKUP_DIR"] = f"{workdir}/backups"
+    os.environ.setdefault("CIRCUITS_SESSION_SWEEP_POLICY", "off")
+    os.environ["CIRCUITS_ADMIN_TOKEN"] = HARNESS_ADMIN_TOKEN
+    sys.exit(main())
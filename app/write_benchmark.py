@@ -0,0 +1,231 @@
+"""Compare write throughput with and without the group-commit writer.
+
+Run ``python -m app.write_benchmark``. Each mode gets a fresh temporary
+database and several processes, as if they were uvicorn workers. Every
+process boots the app and its threads send a mix of session saves
+(``PUT /session``) and recorded runs (``POST /runs``) for a fixed time. The
+report shows requests per second, latency, and how many requests failed
+because SQLite reported the database as locked or busy.
+
+"deferred commit" reproduces the handlers before the writer thread: a
+deferred BEGIN that takes the write lock on the first write, and one commit
+per request. "immediate commit" is today's inline path with group commit
+disabled.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+# Mode name -> (CIRCUITS_GROUP_COMMIT, whether inline writes BEGIN IMMEDIATE).
+MODES = {
+    "deferred commit": ("0", False),
+    "immediate commit": ("0", True),
+    "group commit": ("1", True),
+}
+TASKS_PER_CIRCUIT = 5
+# One in this many requests records a run; the rest save session progress.
+RUN_EVERY = 5
+
+
+def _configure(database_url: str, group_commit: str) -> None:
+    os.environ["CIRCUITS_DATABASE_URL"] = database_url
+    os.environ["CIRCUITS_GROUP_COMMIT"] = group_commit
+    os.environ["CIRCUITS_SESSION_SWEEP_POLICY"] = "off"
+    os.environ["CIRCUITS_BACKUP_INTERVAL_SECONDS"] = "0"
+    os.environ["CIRCUITS_QUERY_BUDGET"] = "off"
+
+
+def _seed(database_url: str, circuits: int) -> None:
+    _configure(database_url, "0")
+    from fastapi.testclient import TestClient
+
+    from .main import app
+
+    tasks = [{"name": f"Task {index}", "duration": 30} for index in range(TASKS_PER_CIRCUIT)]
+    with TestClient(app) as client:
+        for index in range(circuits):
+            client.post("/api/circuits", json={"name": f"Circuit {index}", "tasks": tasks})
+
+
+def _is_lock_error(exc: BaseException) -> bool:
+    message = str(exc).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def _worker(
+    database_url: str,
+    group_commit: str,
+    begin_immediate: bool,
+    process_index: int,
+    threads: int,
+    circuits: int,
+    start_at: float,
+    seconds: float,
+    results: "multiprocessing.Queue[Dict[str, Any]]",
+) -> None:
+    _configure(database_url, group_commit)
+    from fastapi.testclient import TestClient
+
+    from .database import write_queue
+    from .main import app
+
+    write_queue.begin_immediate = begin_immediate
+    latencies: List[float] = []
+    counts = {"ok": 0, "lock_errors": 0, "other_errors": 0}
+    lock = threading.Lock()
+
+    def session_payload(step: int) -> Dict[str, Any]:
+        statuses = ["completed"] * (step % TASKS_PER_CIRCUIT)
+        statuses += ["pending"] * (TASKS_PER_CIRCUIT - len(statuses))
+        return {
+            "status": "in_progress",
+            "current_index": step % TASKS_PER_CIRCUIT,
+            "remaining_seconds": 30,
+            "has_started": True,
+            "running": True,
+            "task_statuses": statuses,
+        }
+
+    def loop(client: TestClient, thread_index: int) -> None:
+        circuit_id = (process_index * threads + thread_index) % circuits + 1
+        step = 0
+        while time.time() < start_at:
+            time.sleep(0.001)
+        deadline = start_at + seconds
+        while time.time() < deadline:
+            step += 1
+            began = time.perf_counter()
+            try:
+                if step % RUN_EVERY == 0:
+                    response = client.post(
+                        f"/api/circuits/{circuit_id}/runs",
+                        json={"tasks": [{"index": 0, "status": "completed"}]},
+                    )
+                else:
+                    response = client.put(
+                        f"/api/circuits/{circuit_id}/session", json=session_payload(step)
+                    )
+                outcome = "ok" if response.status_code < 400 else "other_errors"
+            except Exception as exc:
+                outcome = "lock_errors" if _is_lock_error(exc) else "other_errors"
+            elapsed = time.perf_counter() - began
+            with lock:
+                counts[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(elapsed)
+
+    with TestClient(app) as client:
+        workers = [
+            threading.Thread(target=loop, args=(client, index)) for index in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    results.put({**counts, "latencies": latencies})
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_mode(
+    group_commit: str,
+    begin_immediate: bool,
+    processes: int,
+    threads: int,
+    circuits: int,
+    seconds: float,
+) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix="circuits-bench-") as workdir:
+        database_url = f"sqlite:///{workdir}/circuits.db"
+        seeder = context.Process(target=_seed, args=(database_url, circuits))
+        seeder.start()
+        seeder.join()
+
+        results = context.Queue()
+        # Give every process time to import the app before the clock starts.
+        start_at = time.time() + 3.0
+        workers = [
+            context.Process(
+                target=_worker,
+                args=(
+                    database_url,
+                    group_commit,
+                    begin_immediate,
+                    index,
+                    threads,
+                    circuits,
+                    start_at,
+                    seconds,
+                    results,
+                ),
+            )
+            for index in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        reports = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+
+    latencies = [value for report in reports for value in report["latencies"]]
+    ok = sum(report["ok"] for report in reports)
+    return {
+        "ok": ok,
+        "throughput": ok / seconds,
+        "lock_errors": sum(report["lock_errors"] for report in reports),
+        "other_errors": sum(report["other_errors"] for report in reports),
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--circuits", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{args.processes} processes x {args.threads} threads, "
+        f"{args.circuits} circuits, {args.seconds:g}s per mode"
+    )
+    print(
+        f"{'mode':<20} {'requests':>9} {'req/s':>9} {'locked':>7} "
+        f"{'failed':>7} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for name, (group_commit, begin_immediate) in MODES.items():
+        result = run_mode(
+            group_commit,
+            begin_immediate,
+            args.processes,
+            args.threads,
+            args.circuits,
+            args.seconds,
+        )
+        print(
+            f"{name:<20} {result['ok']:>9} {result['throughput']:>9.1f} "
+            f"{result['lock_errors']:>7} {result['other_errors']:>7} "
+            f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
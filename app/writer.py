@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, NamedTuple
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT = os.environ.get("CIRCUITS_GROUP_COMMIT", "1") not in {"0", "false", "no"}
+# Upper bound on writes sharing one transaction, so a long queue cannot hold
+# the SQLite write lock indefinitely.
+WRITE_BATCH_SIZE = int(os.environ.get("CIRCUITS_WRITE_BATCH_SIZE", "64"))
+
+WriteFunc = Callable[[Session], Any]
+
+
+class _WriteJob(NamedTuple):
+    func: WriteFunc
+    context: contextvars.Context
+    future: Future
+
+
+class WriteQueue:
+    """Runs every database write of this process on one thread with group commit.
+
+    ``run`` hands a function taking a ``Session`` to the writer thread and
+    waits for its result. The writer drains whatever is queued, opens one
+    ``BEGIN IMMEDIATE`` transaction, runs each job inside its own SAVEPOINT and
+    commits once for the batch, so concurrent requests share the write lock,
+    the commit and the WAL sync instead of contending for them. A job that
+    raises only rolls back its savepoint and the exception is re-raised in
+    the caller. Jobs must flush rather than commit and should return plain
+    data, since ORM objects are shared by every job in a batch.
+
+    When group commit is disabled or the thread is not running (scripts,
+    tests without startup), ``run`` executes the job in its own transaction
+    on the calling thread.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        batch_size: int = WRITE_BATCH_SIZE,
+        enabled: bool = GROUP_COMMIT,
+        begin_immediate: bool = True,
+    ) -> None:
+        self._engine = engine
+        self.batch_size = max(batch_size, 1)
+        self.enabled = enabled
+        # Only the benchmark turns this off, to measure handlers that took
+        # the write lock lazily on their first write.
+        self.begin_immediate = begin_immediate
+        self._queue: "queue.SimpleQueue[_WriteJob | None]" = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            # New writes run inline from here on; jobs queued before the
+            # sentinel are still committed by the writer.
+            self._thread = None
+            self._queue.put(None)
+            thread.join()
+            # A job that raced past the sentinel is committed here instead.
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    self._commit_batch([job])
+
+    def submit(self, func: WriteFunc) -> Future:
+        future: Future = Future()
+        thread = self._thread
+        if thread is None or threading.current_thread() is thread:
+            try:
+                future.set_result(self._run_inline(func))
+            except BaseException as exc:
+                future.set_exception(exc)
+            return future
+        # The caller's context travels with the job so per-request state such
+        # as the query counter sees the statements the job issues.
+        self._queue.put(_WriteJob(func, contextvars.copy_context(), future))
+        return future
+
+    def run(self, func: WriteFunc) -> Any:
+        return self.submit(func).result()
+
+    def _run_inline(self, func: WriteFunc) -> Any:
+        with Session(self._engine, expire_on_commit=False) as session:
+            # Same up-front write lock as a batch, so a job's reads and writes
+            # are serialised against other writers in either mode.
+            if self.begin_immediate:
+                session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            result = func(session)
+            session.commit()
+        return result
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List[_WriteJob]) -> None:
+        outcomes: List[tuple[_WriteJob, Any, BaseException | None]] = []
+        try:
+            with Session(self._engine, expire_on_commit=False) as session:
+                # Take the write lock up front: the busy timeout then covers
+                # the whole batch and a deferred read can never fail to upgrade.
+                session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                for job in batch:
+                    if not job.future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with session.begin_nested():
+                            # Emit the SAVEPOINT here rather than lazily
+                            # inside the job, which would bill it to the job.
+                            session.connection()
+                            result = job.context.run(job.func, session)
+                    except Exception as exc:
+                        outcomes.append((job, None, exc))
+                    else:
+                        outcomes.append((job, result, None))
+                session.commit()
+        except Exception as exc:
+            logger.exception("Write batch of %s jobs failed", len(batch))
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(exc)
+            return
+
+        for job, result, error in outcomes:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
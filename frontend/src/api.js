@@ -14,7 +14,9 @@ async function handleResponse(response) {
         message = text;
       }
     }
-    throw new Error(message);
+    const error = new Error(message);
+    error.status = response.status;
+    throw error;
   }
   if (response.status === 204) {
     return null;
@@ -22,6 +24,42 @@ async function handleResponse(response) {
   return response.json();
 }
 
+const IDEMPOTENT_RETRY_ATTEMPTS = 3;
+const IDEMPOTENT_RETRY_DELAY_MS = 1000;
+
+export function createIdempotencyKey() {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Network failures are retried with the same key, so the server replays the
+// original response instead of recording the run twice.
+async function postIdempotent(url, payload, idempotencyKey) {
+  const key = idempotencyKey || createIdempotencyKey();
+  let lastError = null;
+  for (let attempt = 0; attempt < IDEMPOTENT_RETRY_ATTEMPTS; attempt += 1) {
+    if (attempt > 0) {
+      await new Promise((resolve) => setTimeout(resolve, IDEMPOTENT_RETRY_DELAY_MS * attempt));
+    }
+    try {
+      const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+        body: JSON.stringify(payload),
+      });
+      return handleResponse(response);
+    } catch (error) {
+      if (!(error instanceof TypeError)) {
+        throw error;
+      }
+      lastError = error;
+    }
+  }
+  throw lastError;
+}
+
 export async function listCircuits() {
   const response = await fetch(`${BASE_URL}/circuits`);
   return handleResponse(response);
@@ -62,13 +100,8 @@ export async function fetchHealth() {
   return handleResponse(response);
 }
 
-export async function createCircuitRun(circuitId, payload) {
-  const response = await fetch(`${BASE_URL}/circuits/${circuitId}/runs`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(payload),
-  });
-  return handleResponse(response);
+export async function createCircuitRun(circuitId, payload, { idempotencyKey } = {}) {
+  return postIdempotent(`${BASE_URL}/circuits/${circuitId}/runs`, payload, idempotencyKey);
 }
 
 export async function getCircuitSession(circuitId) {
@@ -88,22 +121,30 @@ export async function updateCircuitSession(circuitId, payload) {
   return handleResponse(response);
 }
 
-export async function deleteCircuitSession(circuitId) {
+export async function patchCircuitSession(circuitId, payload) {
   const response = await fetch(`${BASE_URL}/circuits/${circuitId}/session`, {
-    method: 'DELETE',
+    method: 'PATCH',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload),
   });
   return handleResponse(response);
 }
 
-export async function finishCircuitSession(circuitId, payload) {
-  const response = await fetch(`${BASE_URL}/circuits/${circuitId}/session/finish`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(payload),
+export async function deleteCircuitSession(circuitId) {
+  const response = await fetch(`${BASE_URL}/circuits/${circuitId}/session`, {
+    method: 'DELETE',
   });
   return handleResponse(response);
 }
 
+export async function finishCircuitSession(circuitId, payload, { idempotencyKey } = {}) {
+  return postIdempotent(
+    `${BASE_URL}/circuits/${circuitId}/session/finish`,
+    payload,
+    idempotencyKey
+  );
+}
+
 export async function listCircuitRuns() {
   const response = await fetch(`${BASE_URL}/runs`);
   return handleResponse(response);
@@ -115,3 +156,4 @@ export async function deleteCircuitRun(id) {
   });
   return handleResponse(response);
 }
+
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import os
+import tempfile
+from typing import Any, Callable, Dict
+
+import pytest
+
+# The app binds its engine at import time, so point it at a throwaway
+# database before any test imports it.
+_WORKDIR = tempfile.mkdtemp(prefix="circuits-tests-")
+os.environ["CIRCUITS_DATABASE_URL"] = f"sqlite:///{_WORKDIR}/circuits.db"
+os.environ["CIRCUITS_BACKUP_DIR"] = f"{_WORKDIR}/backups"
+os.environ["CIRCUITS_BACKUP_INTERVAL_SECONDS"] = "0"
+os.environ["CIRCUITS_SESSION_SWEEP_POLICY"] = "off"
+os.environ["CIRCUITS_QUERY_BUDGET"] = "off"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_circuit(client) -> Callable[..., Dict[str, Any]]:
+    def make(durations=(10, 20, 30, 40)) -> Dict[str, Any]:
+        tasks = [
+            {"name": f"Task {index}", "duration": duration}
+            for index, duration in enumerate(durations)
+        ]
+        response = client.post("/api/circuits", json={"name": "Circuit", "tasks": tasks})
+        assert response.status_code == 201
+        return response.json()
+
+    return make
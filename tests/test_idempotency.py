@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+RUN_PAYLOAD = {"tasks": [{"index": 0, "status": "completed"}]}
+
+
+def run_count(client, circuit_id):
+    return sum(1 for run in client.get("/api/runs").json() if run["circuit_id"] == circuit_id)
+
+
+def test_repeated_key_replays_the_stored_response(client, make_circuit):
+    circuit = make_circuit()
+    url = f"/api/circuits/{circuit['id']}/runs"
+    headers = {"Idempotency-Key": "replay-runs"}
+
+    first = client.post(url, json=RUN_PAYLOAD, headers=headers)
+    second = client.post(url, json=RUN_PAYLOAD, headers=headers)
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert second.json() == first.json()
+    assert run_count(client, circuit["id"]) == 1
+
+
+def test_replay_survives_circuit_deletion(client, make_circuit):
+    circuit = make_circuit()
+    url = f"/api/circuits/{circuit['id']}/runs"
+    headers = {"Idempotency-Key": "replay-after-delete"}
+
+    first = client.post(url, json=RUN_PAYLOAD, headers=headers)
+    assert client.delete(f"/api/circuits/{circuit['id']}").status_code == 204
+    retry = client.post(url, json=RUN_PAYLOAD, headers=headers)
+
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+    fresh = client.post(url, json=RUN_PAYLOAD, headers={"Idempotency-Key": "after-delete-new"})
+    assert fresh.status_code == 404
+
+
+def test_key_reused_for_another_endpoint_is_rejected(client, make_circuit):
+    circuit = make_circuit()
+    headers = {"Idempotency-Key": "reused-key"}
+    created = client.post(
+        f"/api/circuits/{circuit['id']}/runs", json=RUN_PAYLOAD, headers=headers
+    )
+    assert created.status_code == 201
+
+    reused = client.post(
+        f"/api/circuits/{circuit['id']}/session/finish", json={}, headers=headers
+    )
+    assert reused.status_code == 422
+
+
+def test_failed_request_leaves_the_key_free(client, make_circuit):
+    circuit = make_circuit()
+    url = f"/api/circuits/{circuit['id']}/runs"
+    headers = {"Idempotency-Key": "retry-after-422"}
+
+    invalid = client.post(url, json={"tasks": [{"index": 99, "status": "completed"}]}, headers=headers)
+    assert invalid.status_code == 422
+    valid = client.post(url, json=RUN_PAYLOAD, headers=headers)
+    assert valid.status_code == 201
+    assert "Idempotent-Replayed" not in valid.headers
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import pytest
+
+
+def start_session(client, circuit, current_index=0, remaining_seconds=5):
+    count = circuit["task_count"]
+    statuses = ["completed"] * current_index + ["pending"] * (count - current_index)
+    response = client.put(
+        f"/api/circuits/{circuit['id']}/session",
+        json={
+            "status": "paused",
+            "current_index": current_index,
+            "remaining_seconds": remaining_seconds,
+            "has_started": True,
+            "running": False,
+            "task_statuses": statuses,
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_patch_applies_once_per_version(client, make_circuit):
+    circuit = make_circuit()
+    session = start_session(client, circuit)
+    url = f"/api/circuits/{circuit['id']}/session"
+    patch = {"version": session["version"], "task_statuses": {"0": "completed"}}
+
+    applied = client.patch(url, json={**patch, "current_index": 1})
+    stale = client.patch(url, json={**patch, "current_index": 2})
+
+    assert applied.status_code == 200
+    assert applied.json()["version"] == session["version"] + 1
+    assert stale.status_code == 409
+    current = client.get(url).json()
+    assert current["current_index"] == 1
+    assert current["task_statuses"][0] == "completed"
+
+
+def test_put_checks_the_version_when_given(client, make_circuit):
+    circuit = make_circuit()
+    session = start_session(client, circuit)
+    url = f"/api/circuits/{circuit['id']}/session"
+    payload = {"task_statuses": ["pending"] * circuit["task_count"]}
+
+    assert client.put(url, json={**payload, "version": session["version"] + 1}).status_code == 409
+    updated = client.put(url, json={**payload, "version": session["version"]})
+    assert updated.status_code == 200
+    assert updated.json()["version"] == session["version"] + 1
+    assert client.put(url, json=payload).status_code == 200
+
+
+def splice(client, circuit, **payload):
+    response = client.patch(f"/api/circuits/{circuit['id']}/tasks", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()["active_run"]
+
+
+@pytest.mark.parametrize(
+    "edit, expected_index, expected_remaining",
+    [
+        # Removing a task before the current one shifts the index down.
+        ({"offset": 0, "delete_count": 1}, 1, 5),
+        # Inserting before the current task shifts it up.
+        ({"offset": 1, "tasks": [{"name": "New", "duration": 7}]}, 3, 5),
+        # Editing after the current task leaves it alone.
+        ({"offset": 3, "delete_count": 1, "tasks": [{"name": "New", "duration": 7}]}, 2, 5),
+        # Replacing the current task restarts it with the new duration.
+        ({"offset": 2, "delete_count": 1, "tasks": [{"name": "New", "duration": 7}]}, 2, 7),
+        # Deleting the current task moves on to the one that took its place.
+        ({"offset": 2, "delete_count": 1}, 2, 40),
+    ],
+)
+def test_splice_keeps_the_session_on_its_task(
+    client, make_circuit, edit, expected_index, expected_remaining
+):
+    circuit = make_circuit((10, 20, 30, 40))
+    start_session(client, circuit, current_index=2, remaining_seconds=5)
+
+    active = splice(client, circuit, **edit)
+
+    assert active["current_index"] == expected_index
+    assert active["remaining_seconds"] == expected_remaining
+    tasks = client.get(f"/api/circuits/{circuit['id']}").json()["tasks"]
+    assert len(active["task_statuses"]) == len(tasks)
+    assert active["task_statuses"][expected_index] == "pending"
+
+
+def test_put_rejects_statuses_for_an_outdated_circuit(client, make_circuit):
+    from app.main import CircuitRef, app, require_circuit
+
+    circuit = make_circuit()
+    # The circuit as the handler saw it just before a concurrent edit landed.
+    stale = CircuitRef(circuit["id"], 0, circuit["name"], circuit["task_count"])
+    app.dependency_overrides[require_circuit] = lambda: stale
+    try:
+        response = client.put(
+            f"/api/circuits/{circuit['id']}/session",
+            json={"task_statuses": ["pending"] * circuit["task_count"]},
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 409
+    assert client.get(f"/api/circuits/{circuit['id']}/session").status_code == 404
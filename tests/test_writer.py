@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.writer import WriteQueue
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/writer.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE item (name TEXT NOT NULL)"))
+    yield engine
+    engine.dispose()
+
+
+def names(engine):
+    with engine.connect() as conn:
+        return sorted(row[0] for row in conn.execute(text("SELECT name FROM item")))
+
+
+def insert(name, fail=False):
+    def job(session):
+        session.execute(text("INSERT INTO item (name) VALUES (:name)"), {"name": name})
+        if fail:
+            raise ValueError(name)
+        return name
+
+    return job
+
+
+def test_failed_job_only_rolls_back_its_savepoint(engine):
+    queue = WriteQueue(engine, enabled=True)
+    queue.start()
+    try:
+        # Hold the writer so the next jobs are committed as one batch.
+        release = threading.Event()
+        blocker = queue.submit(lambda session: release.wait(5))
+        futures = [
+            queue.submit(insert("first")),
+            queue.submit(insert("broken", fail=True)),
+            queue.submit(insert("last")),
+        ]
+        release.set()
+        blocker.result()
+        assert futures[0].result() == "first"
+        with pytest.raises(ValueError, match="broken"):
+            futures[1].result()
+        assert futures[2].result() == "last"
+    finally:
+        queue.stop()
+    assert names(engine) == ["first", "last"]
+
+
+def test_inline_job_commits_or_rolls_back_as_a_whole(engine):
+    queue = WriteQueue(engine, enabled=False)
+    queue.start()
+    assert not queue.running
+    assert queue.run(insert("kept")) == "kept"
+    with pytest.raises(ValueError):
+        queue.run(insert("dropped", fail=True))
+    assert names(engine) == ["kept"]
+
+
+def test_jobs_queued_before_stop_are_committed(engine):
+    queue = WriteQueue(engine, enabled=True)
+    queue.start()
+    futures = [queue.submit(insert(f"job {index}")) for index in range(5)]
+    queue.stop()
+    assert [future.result() for future in futures] == [f"job {index}" for index in range(5)]
+    assert len(names(engine)) == 5